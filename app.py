@@ -1,83 +1,353 @@
 import dash
-from dash import dcc, html, Input, Output, State, ALL, callback_context, no_update
+from dash import dcc, html, Input, Output, State, ALL, MATCH, ClientsideFunction, Patch, callback_context, no_update
+from dash.exceptions import PreventUpdate
 import pandas as pd
 import dash_bootstrap_components as dbc
-import plotly.express as px
 import plotly.graph_objects as go
+from plotly.colors import qualitative
 from plotly.subplots import make_subplots
+import hmac
 import json
+import logging
 from datetime import datetime
 import io
-import base64
-import xlsxwriter
+import os
+import tempfile
+import unicodedata
+import uuid
 from io import BytesIO
+from urllib.parse import quote
+
+from flask import Response, abort, request, send_file
+
+from cache import FileCache
+from coalesce import RequestSequencer
+from cube import node_path
+from data_loader import DataReloader, expand_frame, open_source
+from data_store import DataStore, PRIORITIES
+from dataset import AVG_MT, load_lost_deals
+from excel_report import write_recovery_report
+from export_jobs import ExportJobRunner
+from export_pipeline import ExportPipeline, dumps, server_timing
+from history import HistoryStore
+from instrumentation import CallbackMetrics
+from months import current_month, month_key
+from primary import PrimaryElection, PrimaryLock
+from recovery_engine import compute_recovery, rate_matrix, recovery_payload
+from scenario_sweep import MAX_SCENARIOS, run_sweep
+from scenarios import ScenarioStore, problem_rates, rate_vector, scenario_diff
+from session_store import SessionStore
+from shared_data import SharedDataStore, SharedDataWatcher, attach_index
+from stream_export import (DATASETS, STREAM_FORMATS, analysis_frames, iter_csv, iter_parquet,
+                           parquet_available, raw_frames)
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# RECOVERY_DATA_SOURCE points at a CSV, Parquet or SQLite file with the
+# lost-deals table; without it the built-in sample below is used. A table
+# with District (and Rep) columns holds detail rows and enables drill-down.
+DATA_SOURCE = os.environ.get('RECOVERY_DATA_SOURCE')
+DATA_TABLE = os.environ.get('RECOVERY_DATA_TABLE', 'lost_deals')
+DATA_WATERMARK = os.environ.get('RECOVERY_DATA_WATERMARK', 'rowid')
+RELOAD_INTERVAL = float(os.environ.get('RECOVERY_RELOAD_INTERVAL', '30'))
+# Run the slider recovery math in the browser (assets/recovery.js) instead
+# of round-tripping every slider change to the server
+CLIENTSIDE_CALCULATIONS = os.environ.get('RECOVERY_CLIENTSIDE_CALCULATIONS', '0') == '1'
+# Rendered but not yet downloaded export files kept per worker (MB), keyed
+# by (state, data version, rates); a file is dropped once downloaded
+EXPORT_CACHE_MB = float(os.environ.get('RECOVERY_EXPORT_CACHE_MB', '64'))
+# Write workbooks with the single-pass constant_memory writer (excel_report.py);
+# set to 0 to fall back to the pandas to_excel + reformat path
+FAST_EXCEL_EXPORT = os.environ.get('RECOVERY_FAST_EXCEL_EXPORT', '1') == '1'
+# On-disk caches shared by all workers on the host (export workbooks, ...)
+CACHE_DIR = os.environ.get('RECOVERY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'recovery-dashboard'))
+# Serialized overview figures kept on disk, shared across workers
+FIGURE_CACHE_SIZE = int(os.environ.get('RECOVERY_FIGURE_CACHE_SIZE', '256'))
+# Process-pool size for multi-state exports (default: one per CPU)
+EXPORT_WORKERS = int(os.environ.get('RECOVERY_EXPORT_WORKERS', '0')) or None
+# Hold the table with categorical keys and narrow numeric dtypes
+COMPACT_DATA = os.environ.get('RECOVERY_COMPACT_DATA', '1') == '1'
+# Lost reasons (highest national Total Lost first) in the state comparison heatmap
+COMPARISON_REASONS = int(os.environ.get('RECOVERY_COMPARISON_REASONS', '15'))
+# Per-callback latency/payload metrics on /metrics and a debug overlay in the page
+METRICS = os.environ.get('RECOVERY_METRICS', '0') == '1'
+# Bearer token for /metrics and /cache-stats (Authorization: Bearer <token>);
+# unset (the default), both endpoints answer 404
+STATS_TOKEN = os.environ.get('RECOVERY_STATS_TOKEN', '')
+# Slider updates: 'mouseup' fires once per release, 'drag' on every step
+SLIDER_UPDATEMODE = os.environ.get('RECOVERY_SLIDER_UPDATEMODE', 'mouseup')
+# Coalesce slider changes in the browser for this long before calling the
+# server (0: no delay); the server still drops superseded requests
+SLIDER_DEBOUNCE_MS = int(os.environ.get('RECOVERY_SLIDER_DEBOUNCE_MS', '0'))
+# Scenarios listed per what-if sweep
+SWEEP_TOP_N = int(os.environ.get('RECOVERY_SWEEP_TOP_N', '10'))
+# Top problems (highest Total Lost) per state that get conversion sliders
+TOP_PROBLEMS = int(os.environ.get('RECOVERY_TOP_PROBLEMS', '3'))
+# Problems per page of slider and result cards; more than this adds pagination
+PROBLEMS_PER_PAGE = int(os.environ.get('RECOVERY_PROBLEMS_PER_PAGE', '10'))
+# Monthly lost-deals history behind the trend card: path of the SQLite file
+# that keeps it, on persistent storage. Unset (the default), no history is kept
+HISTORY_DB = os.environ.get('RECOVERY_HISTORY_DB', '')
+# Lock file electing the primary worker, which writes the history and, with
+# shared data, reloads the source; set by gunicorn.conf.py. Unset, this
+# process is the primary
+PRIMARY_LOCK = os.environ.get('RECOVERY_PRIMARY_LOCK', '')
+# Named slider scenarios: path of the SQLite file that keeps them, e.g.
+# /var/lib/recovery-dashboard/scenarios.sqlite3. Unset (the default), the
+# Saved Scenarios card is not shown; use persistent storage, not a temp dir
+SCENARIO_DB = os.environ.get('RECOVERY_SCENARIO_DB', '')
+# Request header with the signed-in user, set by an authenticating proxy;
+# without it scenarios belong to the browser they were saved from
+USER_HEADER = os.environ.get('RECOVERY_USER_HEADER', '')
+# Slider results kept on disk, shared across workers, keyed by (state, data
+# version, slider vector); entries unused for CALC_CACHE_TTL seconds expire
+CALC_CACHE_SIZE = int(os.environ.get('RECOVERY_CALC_CACHE_SIZE', '4096'))
+CALC_CACHE_TTL = float(os.environ.get('RECOVERY_CALC_CACHE_TTL', '3600')) or None
+# Keep the calculations-store payload server-side (in-process LRU over a
+# SQLite file shared by the workers); the browser then holds only its key.
+# Not used with RECOVERY_CLIENTSIDE_CALCULATIONS, where the browser computes it
+SESSION_STORE = os.environ.get('RECOVERY_SESSION_STORE', '0') == '1'
+SESSION_CACHE_SIZE = int(os.environ.get('RECOVERY_SESSION_CACHE_SIZE', '1024'))
+SESSION_TTL = float(os.environ.get('RECOVERY_SESSION_TTL', '86400')) or None
+# Published memory-mapped table to attach to; set for the workers by
+# gunicorn.conf.py when RECOVERY_SHARED_DATA=1
+SHARED_DATA_DIR = os.environ.get('RECOVERY_SHARED_DATA_DIR')
 
 # --- Enhanced Data Setup ---
-data = {
-    'State': ['APTS', 'APTS', 'APTS', 'KA', 'KA', 'KA', 'MH', 'MH', 'MH', 'TN', 'TN', 'TN', 'WB', 'WB', 'WB'],
-    'Lost Reason': [
-        'Bidding/ Requirement cancelled/ Uncertain/ Delay',
-        'P- Same brand', 'Price discovery', 'P- Same brand', 'P- Other brand', 'Credit',
-        'Credit', 'P- Same brand', 'Bidding/ Requirement cancelled/ Uncertain/ Delay',
-        'Price discovery', 'Others', 'Bidding/ Requirement cancelled/ Uncertain/ Delay',
-        'Price discovery', 'Bidding/ Requirement cancelled/ Uncertain/ Delay', 'Others'
-    ],
-    'Total Lost': [54, 37, 33, 66, 11, 7, 113, 46, 45, 53, 20, 17, 20, 11, 9],
-    'P1': [6, 1, 1, 11, 1, 0, 0, 1, 3, 9, 5, 5, 2, 1, 0],
-    'P2': [4, 4, 3, 9, 4, 0, 3, 1, 5, 7, 4, 1, 3, 2, 2],
-    'P3': [8, 3, 3, 8, 0, 1, 0, 2, 5, 3, 3, 0, 0, 1, 2],
-    'P4': [36, 29, 26, 38, 6, 6, 110, 42, 32, 34, 8, 11, 15, 7, 5]
-}
+data_source = None
+data_reloader = None
+shared_data_watcher = None
+history = HistoryStore(HISTORY_DB) if HISTORY_DB else None
+scenario_store = ScenarioStore(SCENARIO_DB) if SCENARIO_DB else None
+if SHARED_DATA_DIR:
+    # Under gunicorn.conf.py the master has loaded and indexed the table;
+    # attach to its memory-mapped columns and follow the versions published
+    # by the primary, which polls the source (see become_primary)
+    data_store = SharedDataStore(None, SHARED_DATA_DIR, index=attach_index(SHARED_DATA_DIR))
+    if RELOAD_INTERVAL > 0:
+        shared_data_watcher = SharedDataWatcher(SHARED_DATA_DIR, data_store, interval=RELOAD_INTERVAL).start()
+else:
+    data_source = open_source(DATA_SOURCE, table=DATA_TABLE, watermark=DATA_WATERMARK) if DATA_SOURCE else None
+    # Per-state partitions, top problems and summaries, built once per data version
+    data_store = DataStore(load_lost_deals(data_source, compact=COMPACT_DATA), top_n=TOP_PROBLEMS)
+
+    # Apply new/changed source rows in the background; callbacks keep reading
+    # the previous index until the rebuilt one is swapped in
+    if data_source is not None and RELOAD_INTERVAL > 0:
+        data_reloader = DataReloader(data_source, data_store, interval=RELOAD_INTERVAL, avg_mt=AVG_MT,
+                                     compact=COMPACT_DATA).start()
+
+def become_primary():
+    """Take over the history and, with shared data, reloading the source"""
+    global data_source, data_reloader
+    if history is not None:
+        # The live table is this month's snapshot; skipped if already recorded
+        index = data_store.current
+        history.record_snapshot(index.frame, current_month(), version=index.version)
+    if data_reloader is not None:
+        data_reloader.history = history
+    elif SHARED_DATA_DIR and DATA_SOURCE and RELOAD_INTERVAL > 0:
+        # This process never loaded the source: its first poll reads the
+        # whole table and diffs it against the published one
+        data_source = open_source(DATA_SOURCE, table=DATA_TABLE, watermark=DATA_WATERMARK)
+        data_reloader = DataReloader(data_source, data_store, interval=RELOAD_INTERVAL, avg_mt=AVG_MT,
+                                     compact=COMPACT_DATA, history=history).start()
+
+if PRIMARY_LOCK:
+    # Retried until this worker holds the lock, so another takes over when the primary exits
+    primary_election = PrimaryElection(PrimaryLock(PRIMARY_LOCK), become_primary,
+                                       interval=RELOAD_INTERVAL or 30.0).start()
+else:
+    become_primary()
+
+# Multi-state exports run in a local process pool; workbooks are cached on disk
+export_jobs = ExportJobRunner(os.path.join(CACHE_DIR, 'exports'), max_workers=EXPORT_WORKERS)
+
+# Newest slider request per page session, to drop superseded ones
+slider_requests = RequestSequencer(os.path.join(CACHE_DIR, 'slider-requests.sqlite3'))
+
+# Callback timings and response sizes; no-op unless RECOVERY_METRICS=1
+metrics = CallbackMetrics(enabled=METRICS)
 
-df = pd.DataFrame(data)
-avg_mt = {'APTS': 14.8, 'WB': 31.5, 'MH': 10.1, 'TN': 21.5, 'KA': 15.2}
-df['Avg_MT'] = df['State'].map(avg_mt)
+# Overview figures keyed by (state, data version)
+figure_cache = FileCache(os.path.join(CACHE_DIR, 'figures'), max_entries=FIGURE_CACHE_SIZE)
+
+# Slider results (calculations-store payload and rendered leaves)
+calculation_cache = FileCache(os.path.join(CACHE_DIR, 'calculations'), max_entries=CALC_CACHE_SIZE,
+                              ttl=CALC_CACHE_TTL)
+SLIDER_STEP = 5
+
+# Scenario payloads behind calculations-store keys
+session_store = None
+if SESSION_STORE and not CLIENTSIDE_CALCULATIONS:
+    session_store = SessionStore(os.path.join(CACHE_DIR, 'sessions.sqlite3'), max_entries=SESSION_CACHE_SIZE,
+                                 ttl=SESSION_TTL)
 
 # Enhanced utility functions
 def get_top_problems(state):
-    state_data = df[df['State'] == state]
-    return state_data.nlargest(3, 'Total Lost')
+    return data_store.current.top_problems(state)
 
 def calculate_state_summary(state):
-    state_data = df[df['State'] == state]
+    return data_store.current.summary(state)
+
+def calculate_recovery(index, selected_state, slider_values):
+    """Recovery potential for the state's top problems at the given slider values.
+    
+    Returns the calculations-store payload and the formatted leaf values shown
+    in the result cards, per problem. Per-priority leaves are listed in
+    layout order (P1-P4) and only for priorities with lost customers.
+    """
+    calculations_data = recovery_payload(
+        selected_state,
+        index.top_problems(selected_state)['Lost Reason'].tolist(),
+        index.top_customers[selected_state],
+        slider_values,
+        index.avg_mt(selected_state)
+    )
+    
+    leaves = {'problems': []}
+    for problem_calc in calculations_data['problems']:
+        problem_leaves = {'rates': [], 'priority_mt': []}
+        for priority_calc in problem_calc['priorities']:
+            if priority_calc['customers'] > 0:
+                problem_leaves['rates'].append(f"{priority_calc['conversion_rate']}%")
+                problem_leaves['priority_mt'].append(f"{priority_calc['potential_mt']:.1f} MT")
+        problem_leaves['total'] = f"{problem_calc['total_mt']:.1f} MT/month"
+        leaves['problems'].append(problem_leaves)
+    leaves['total'] = f"{calculations_data['total_mt']:.1f} MT/MONTH"
+    
+    return calculations_data, leaves
+
+def quantize_sliders(slider_values, step=SLIDER_STEP, default=50):
+    """Slider values snapped to the slider step; missing sliders take the default"""
+    return tuple(default if value is None else int(step * round(value / step)) for value in slider_values)
+
+def cached_recovery(index, selected_state, slider_values):
+    """calculate_recovery through the shared calculation cache.
+    
+    Keyed by (state, data version, top-N, quantized slider vector), so the
+    same slider positions are computed once per data version across all
+    workers.
+    """
+    rates = quantize_sliders(slider_values)
+    key = f"recovery:{selected_state}:{index.version}:{index.top_n}:{','.join(map(str, rates))}"
+    cached = calculation_cache.get(key)
+    if cached is not None:
+        entry = json.loads(cached)
+        return entry['data'], entry['leaves']
+    calculations_data, leaves = calculate_recovery(index, selected_state, list(rates))
+    calculation_cache.set(key, json.dumps({'data': calculations_data, 'leaves': leaves}))
+    return calculations_data, leaves
+
+def slider_rates(index, selected_state, slider_values, slider_ids=None, previous=None):
+    """Flat rates (problem-major, P1-P4) for all of the state's top problems.
+    
+    Without ``slider_ids`` the values are taken as that flat list. With ids,
+    each value goes to its slider's problem and priority; sliders not on the
+    page keep their rate from the ``previous`` calculations-store payload,
+    or 50.
+    """
+    if slider_ids is None:
+        return list(slider_values)
+    count = len(index.top_customers[selected_state]) * len(PRIORITIES)
+    rates = []
+    if previous and previous.get('state') == selected_state:
+        rates = scenario_rates(previous)
+    if len(rates) != count:
+        rates = [50] * count
+    for value, slider_id in zip(slider_values, slider_ids):
+        if slider_id['state'] != selected_state:
+            continue
+        position = slider_id['problem'] * len(PRIORITIES) + PRIORITIES.index(slider_id['priority'])
+        if position < count:
+            rates[position] = value
+    return rates
+
+def page_problems(count, page, per_page=PROBLEMS_PER_PAGE):
+    """Problem positions shown on ``page`` (1-based) of ``count`` top problems"""
+    start = (max(page, 1) - 1) * per_page
+    return range(min(start, count), min(start + per_page, count))
+
+def page_leaves(leaves, problems):
+    """Result-card leaves of ``problems`` in layout order: (problem totals, rates, priority MT)"""
+    shown = [leaves['problems'][p] for p in problems if p < len(leaves['problems'])]
+    return ([leaf['total'] for leaf in shown],
+            [rate for leaf in shown for rate in leaf['rates']],
+            [mt for leaf in shown for mt in leaf['priority_mt']])
+
+def node_basis(index, node):
+    """Top-problem customer counts and avg MT of a state or drill-down node"""
     return {
-        'total_lost': state_data['Total Lost'].sum(),
-        'avg_mt': avg_mt[state],
-        'problems_count': len(state_data),
-        'highest_loss': state_data['Total Lost'].max(),
-        'highest_loss_reason': state_data.loc[state_data['Total Lost'].idxmax(), 'Lost Reason']
+        'avg_mt': index.avg_mt(node),
+        'problems': index.top_problems(node)['Lost Reason'].tolist(),
+        'customers': index.top_customers[node].tolist()
     }
 
-def convert_to_serializable(obj):
-    """Convert pandas/numpy types to JSON serializable types"""
-    if hasattr(obj, 'item'):  # numpy scalar
-        return obj.item()
-    elif hasattr(obj, 'tolist'):  # numpy array
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_to_serializable(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_to_serializable(item) for item in obj]
-    else:
-        return obj
+def recovery_basis():
+    """Per-state basis for the clientside calculator; drill-down nodes are added on selection"""
+    index = data_store.current
+    return {state: node_basis(index, state) for state in index.states}
+
+def store_calculations(calculations_data):
+    """calculations-store value for a payload: its session store key when that is enabled"""
+    if session_store is None or not calculations_data:
+        return calculations_data
+    return {'ref': session_store.put(calculations_data)}
+
+def load_calculations(stored):
+    """Payload behind a calculations-store value; {} for an unknown or expired key"""
+    if stored and 'ref' in stored:
+        payload = session_store.get(stored['ref']) if session_store is not None else None
+        return payload or {}
+    return stored or {}
+
+def scenario_rates(calculations_data):
+    """Flat slider rates (problem-major, P1-P4) of a calculations-store payload"""
+    return [priority['conversion_rate']
+            for problem in calculations_data.get('problems', [])
+            for priority in problem['priorities']]
+
+def export_url(state, rates, fmt, dataset=None):
+    """Download link for the export routes; the scenario travels in the URL.
+    
+    With a ``dataset`` ('analysis' or 'raw') the link is to the streamed
+    CSV/Parquet export.
+    """
+    rates = ','.join(str(int(r)) for r in rates)
+    path = quote(state, safe='') if dataset is None else f"{quote(state, safe='')}/{dataset}"
+    return app.get_relative_path(f"/export/{path}.{fmt}?rates={rates}")
 
-def generate_export_data(state, calculations):
-    """Generate export data for the current analysis"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def generate_export_data(state, calculations, index=None):
+    """Generate export data for the current analysis (of ``index``, by default the current one).
     
-    # Convert all data to JSON-serializable format
-    export_data = {
-        'timestamp': timestamp,
+    numpy values are left as they are; export_pipeline.dumps serializes them.
+    """
+    index = data_store.current if index is None else index
+    return {
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         'state': state,
         'analysis': calculations,
-        'summary': calculate_state_summary(state)
+        'summary': index.summary(state)
     }
+
+def create_excel_export(state, calculations_data, index=None):
+    """Create a professionally formatted Excel report (of ``index``, by default the current one)"""
+    index = data_store.current if index is None else index
+    if not FAST_EXCEL_EXPORT:
+        return create_excel_export_pandas(state, calculations_data, index)
     
-    return convert_to_serializable(export_data)
+    output = BytesIO()
+    write_recovery_report(output, state, calculations_data, index.summary(state), expand_frame(index.partition(state)),
+                          datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    output.seek(0)
+    return output
 
-def create_excel_export(state, calculations_data):
-    """Create a professionally formatted Excel report"""
+def create_excel_export_pandas(state, calculations_data, index=None):
+    """Excel report via pandas to_excel followed by per-cell formatting"""
     output = BytesIO()
+    index = data_store.current if index is None else index
+    summary = index.summary(state)
     
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         workbook = writer.book
@@ -158,11 +428,11 @@ def create_excel_export(state, calculations_data):
             'Value': [
                 state,
                 datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                calculate_state_summary(state)['total_lost'],
-                f"{avg_mt[state]} MT",
+                summary['total_lost'],
+                f"{summary['avg_mt']} MT",
                 f"{calculations_data.get('total_mt', 0):.1f} MT/month",
                 len(calculations_data.get('problems', [])),
-                calculate_state_summary(state)['highest_loss_reason']
+                summary['highest_loss_reason']
             ]
         })
         
@@ -272,7 +542,7 @@ def create_excel_export(state, calculations_data):
             problem_sheet.set_column('E:E', 28)
         
         # 4. Raw Data Sheet
-        state_data = df[df['State'] == state]
+        state_data = expand_frame(index.partition(state))
         state_data.to_excel(writer, sheet_name='Raw Data', index=False, startrow=2)
         raw_sheet = writer.sheets['Raw Data']
         
@@ -378,113 +648,357 @@ app.index_string = '''
 </html>
 '''
 
+def metrics_overlay():
+    """Floating per-callback timing table, only when metrics are enabled"""
+    if not METRICS:
+        return []
+    return [
+        html.Div(id='metrics-overlay', className="small", style={
+            'position': 'fixed', 'bottom': '10px', 'right': '10px', 'zIndex': 2000,
+            'maxWidth': '560px', 'background': 'rgba(255, 255, 255, 0.95)', 'padding': '8px',
+            'border': '1px solid #cbd5e0', 'borderRadius': '6px', 'fontFamily': 'monospace'
+        }),
+        dcc.Interval(id='metrics-interval', interval=2000)
+    ]
+
+def history_card():
+    """Monthly trend and top reasons over a date range, when history is kept"""
+    if history is None:
+        return []
+    months = history.months()
+    range_props = {}
+    if months:
+        first = pd.Timestamp(months[0])
+        last = pd.Timestamp(months[-1]) + pd.offsets.MonthEnd(0)
+        range_props = {
+            'min_date_allowed': first.date(),
+            'max_date_allowed': last.date(),
+            'start_date': max(first, last - pd.DateOffset(months=12) + pd.offsets.MonthBegin(0)).date(),
+            'end_date': last.date(),
+            'initial_visible_month': last.date()
+        }
+    return [
+        dbc.Card([
+            dbc.CardHeader([
+                html.I(className="fas fa-chart-line me-2"),
+                "Lost Deals History"
+            ], className="h4"),
+            dbc.CardBody([
+                html.Label("Months:", className="small text-muted mb-1 me-2"),
+                dcc.DatePickerRange(id='history-range', display_format='MMM YYYY', **range_props),
+                dbc.Row([
+                    dbc.Col([
+                        html.Div(id='history-trend')
+                    ], md=7),
+                    dbc.Col([
+                        html.Div(id='history-reasons')
+                    ], md=5)
+                ], className="mt-3")
+            ])
+        ], className="mt-4")
+    ]
+
+def scenario_card():
+    """Save, recall and compare named slider scenarios of the selected state"""
+    if scenario_store is None:
+        return []
+    return [
+        dbc.Card([
+            dbc.CardHeader([
+                html.I(className="fas fa-bookmark me-2"),
+                "Saved Scenarios"
+            ], className="h4"),
+            dbc.CardBody([
+                dbc.Row([
+                    dbc.Col([
+                        html.Label("Save current sliders as:", className="small text-muted mb-1"),
+                        dbc.InputGroup([
+                            dbc.Input(id='scenario-name', placeholder="Scenario name", maxLength=80),
+                            dbc.Button([html.I(className="fas fa-save me-2"), "Save"],
+                                       id='scenario-save-btn', color="primary")
+                        ])
+                    ], md=4),
+                    dbc.Col([
+                        html.Label("Scenario:", className="small text-muted mb-1"),
+                        dbc.InputGroup([
+                            dcc.Dropdown(id='scenario-select', placeholder="Saved scenarios",
+                                         className="flex-grow-1"),
+                            dbc.Button([html.I(className="fas fa-undo me-2"), "Recall"],
+                                       id='scenario-recall-btn', color="success"),
+                            dbc.Button(html.I(className="fas fa-trash"), id='scenario-delete-btn',
+                                       color="danger", outline=True)
+                        ])
+                    ], md=5),
+                    dbc.Col([
+                        html.Label("Compare with:", className="small text-muted mb-1"),
+                        dcc.Dropdown(id='scenario-compare', placeholder="Another scenario")
+                    ], md=3)
+                ], className="g-3"),
+                html.Div(id='scenario-status', className="small text-muted mt-2"),
+                html.Div(id='scenario-diff', className="mt-3"),
+                # Scenario owner when no user header is configured
+                dcc.Store(id='scenario-user', storage_type='local', data=uuid.uuid4().hex)
+            ])
+        ], className="mt-4")
+    ]
+
 # Enhanced Layout
-app.layout = dbc.Container([
-    # Header Section
-    html.Div([
-        dbc.Container([
-            dbc.Row([
-                dbc.Col([
-                                         html.H1([
-                         html.I(className="fas fa-chart-line me-3"),
-                         "Recovery Analytics Dashboard"
-                     ], className="mb-2"),
-                     html.P("Strategic State-wise Recovery Potential Analysis", 
-                            className="lead mb-0")
-                ], width=8),
-                dbc.Col([
-                    html.Div([
-                        dbc.Button([
-                            html.I(className="fas fa-download me-2"),
-                            "Export Analysis"
-                        ], id="export-btn", color="light", outline=True, className="me-2"),
+def serve_layout():
+    """Page layout, built per page load from the current data snapshot.
+
+    Dash calls it once at startup to validate callback ids; keep it to
+    cheap component construction (figures come from callbacks). A reload
+    that adds states shows up in the dropdowns without a restart.
+    """
+    states = data_store.current.states
+    return dbc.Container([
+        # Header Section
+        html.Div([
+            dbc.Container([
+                dbc.Row([
+                    dbc.Col([
+                                             html.H1([
+                             html.I(className="fas fa-chart-line me-3"),
+                             "Recovery Analytics Dashboard"
+                         ], className="mb-2"),
+                         html.P("Strategic State-wise Recovery Potential Analysis", 
+                                className="lead mb-0")
+                    ], width=8),
+                    dbc.Col([
+                        html.Div([
+                            dbc.Button([
+                                html.I(className="fas fa-download me-2"),
+                                "Export Analysis"
+                            ], id="export-btn", color="light", outline=True, className="me-2"),
+                            dbc.Button([
+                                html.I(className="fas fa-sync-alt me-2"),
+                                "Reset All"
+                            ], id="reset-btn", color="light", outline=True)
+                        ], className="text-end")
+                    ], width=4)
+                ], align="center")
+            ])
+        ], className="header-gradient"),
+    
+        # Controls Section
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.Label([
+                            html.I(className="fas fa-map-marker-alt me-2"),
+                            "Select State for Analysis:"
+                        ], className="fw-bold mb-2"),
+                        dcc.Dropdown(
+                            id='state-dropdown',
+                            options=[
+                                {'label': f"{s} ({calculate_state_summary(s)['total_lost']} Total Lost)", 
+                                 'value': s} for s in states
+                            ],
+                            value=states[0],
+                            className="mb-3"
+                        ),
+                        # Drill-down below the state; shown when the data has District/Rep columns
+                        html.Div([
+                            dcc.Dropdown(id='district-dropdown', placeholder="All districts", className="mb-2"),
+                            dcc.Dropdown(id='rep-dropdown', placeholder="All sales reps", className="mb-3")
+                        ], id='drill-controls', style={'display': 'none'}),
+                        dcc.Store(id='drill-node', data=states[0]),
+                        html.Div(id="state-summary-cards")
+                    ])
+                ])
+            ], width=4),
+            dbc.Col([
+                html.Div(id="state-overview-chart")
+            ], width=8)
+        ], className="mb-4"),
+    
+        # Main Analysis Section
+        html.Div(id='state-content'),
+    
+        *scenario_card(),
+    
+        # All states side by side, independent of the state dropdown
+        dbc.Card([
+            dbc.CardHeader([
+                html.I(className="fas fa-columns me-2"),
+                "State Comparison"
+            ], className="h4"),
+            dbc.CardBody([
+                dbc.Row([
+                    dbc.Col([
+                        dcc.Graph(id='state-comparison-heatmap', config={'displayModeBar': False})
+                    ], md=7),
+                    dbc.Col([
+                        # Recomputed on request, not on every slider change
                         dbc.Button([
                             html.I(className="fas fa-sync-alt me-2"),
-                            "Reset All"
-                        ], id="reset-btn", color="light", outline=True)
-                    ], className="text-end")
-                ], width=4)
-            ], align="center")
-        ])
-    ], className="header-gradient"),
-    
-    # Controls Section
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    html.Label([
-                        html.I(className="fas fa-map-marker-alt me-2"),
-                        "Select State for Analysis:"
-                    ], className="fw-bold mb-2"),
-                    dcc.Dropdown(
-                        id='state-dropdown',
-                        options=[
-                            {'label': f"{s} ({calculate_state_summary(s)['total_lost']} Total Lost)", 
-                             'value': s} for s in df['State'].unique()
-                        ],
-                        value='APTS',
-                        className="mb-3"
-                    ),
-                    html.Div(id="state-summary-cards")
+                            "Compare at current sliders"
+                        ], id='state-comparison-btn', color="primary", outline=True, size="sm", className="mb-2"),
+                        html.Div(id='state-comparison-recovery')
+                    ], md=5)
                 ])
             ])
-        ], width=4),
-        dbc.Col([
-            html.Div(id="state-overview-chart")
-        ], width=8)
-    ], className="mb-4"),
-    
-    # Main Analysis Section
-    html.Div(id='state-content'),
-    
-    # Export Modal
-    dbc.Modal([
-        dbc.ModalHeader("Export Analysis Results"),
-        dbc.ModalBody(id="export-modal-body"),
-        dbc.ModalFooter([
-            dbc.Button("Close", id="close-export", className="ms-auto", n_clicks=0)
-        ])
-    ], id="export-modal", is_open=False, size="lg"),
+        ], className="mt-4"),
     
-    # Store for calculations
-    dcc.Store(id='calculations-store', data={})
+        *history_card(),
     
-], fluid=True)
+        # What-if sweep over conversion rates for the selected state
+        dbc.Card([
+            dbc.CardHeader([
+                html.I(className="fas fa-flask me-2"),
+                "What-if Sweep"
+            ], className="h4"),
+            dbc.CardBody([
+                dbc.Row([
+                    dbc.Col([
+                        html.Label("Scenarios:", className="small text-muted mb-1"),
+                        dbc.RadioItems(
+                            id='sweep-mode',
+                            options=[
+                                {'label': "Grid: one rate per priority, 5% steps", 'value': 'grid'},
+                                {'label': "Monte Carlo: every slider drawn at random", 'value': 'monte_carlo'}
+                            ],
+                            value='grid'
+                        )
+                    ], md=4),
+                    dbc.Col([
+                        html.Label("Monte Carlo samples:", className="small text-muted mb-1"),
+                        dbc.Input(id='sweep-samples', type='number', min=1000, max=MAX_SCENARIOS,
+                                  step=1000, value=100000)
+                    ], md=3),
+                    dbc.Col([
+                        html.Label("Max average conversion rate (%):", className="small text-muted mb-1"),
+                        dbc.Input(id='sweep-budget', type='number', min=0, max=100, step=5, value=50)
+                    ], md=3),
+                    dbc.Col([
+                        dbc.Button([
+                            html.I(className="fas fa-play me-2"),
+                            "Run Sweep"
+                        ], id='sweep-btn', color="primary", className="w-100")
+                    ], md=2, className="d-flex align-items-end")
+                ], className="g-3 mb-3"),
+                dcc.Loading(html.Div(id='sweep-results'))
+            ])
+        ], className="mt-4 mb-4"),
+    
+        # Export Modal
+        dbc.Modal([
+            dbc.ModalHeader("Export Analysis Results"),
+            dbc.ModalBody([
+                html.Div(id="export-modal-body"),
+            
+                # Multi-state export, generated in the background
+                html.Hr(className="my-4"),
+                html.H6("🗂️ Multi-State Export:", className="mb-3"),
+                dcc.Dropdown(
+                    id='export-states',
+                    options=[{'label': s, 'value': s} for s in states],
+                    multi=True,
+                    placeholder="Select states to export...",
+                    className="mb-3"
+                ),
+                html.Div([
+                    dbc.Button([
+                        html.I(className="fas fa-layer-group me-2"),
+                        "Export Selected States"
+                    ], id="export-selected-btn", color="primary", outline=True, className="me-2"),
+                    dbc.Button([
+                        html.I(className="fas fa-globe me-2"),
+                        "Export All States"
+                    ], id="export-all-btn", color="primary", outline=True)
+                ]),
+                dbc.Progress(id="export-job-progress", value=0, className="mt-3"),
+                html.Div(id="export-job-status", className="mt-2"),
+                dcc.Interval(id="export-job-interval", interval=1000, disabled=True),
+                dcc.Store(id="export-job-store")
+            ]),
+            dbc.ModalFooter([
+                dbc.Button("Close", id="close-export", className="ms-auto", n_clicks=0)
+            ])
+        ], id="export-modal", is_open=False, size="lg"),
+    
+        # Store for calculations
+        dcc.Store(id='calculations-store', data={}),
+    
+        # Coalesced slider values and the page session they belong to
+        dcc.Store(id='slider-input-store'),
+        dcc.Store(id='slider-settings', data={'session': uuid.uuid4().hex, 'debounce_ms': SLIDER_DEBOUNCE_MS}),
+    
+        # Recovery inputs for the clientside calculator, shipped once per page load
+        dcc.Store(id='recovery-basis-store', data=recovery_basis() if CLIENTSIDE_CALCULATIONS else {})
+    
+    ] + metrics_overlay(), fluid=True)
+
+
+app.layout = serve_layout
+
 
 # --- Enhanced Callbacks ---
 
+# Drill-down: state -> district -> sales rep. 'drill-node' holds the
+# selected node's key (the state itself, or e.g. 'KA › North'), which the
+# state views below take in place of the state.
+app.clientside_callback(
+    ClientsideFunction(namespace='recovery', function_name='drill_node'),
+    Output('drill-node', 'data'),
+    [Input('state-dropdown', 'value'),
+     Input('district-dropdown', 'value'),
+     Input('rep-dropdown', 'value')]
+)
+
+def drill_options(index, node):
+    """Dropdown options for the children of a drill-down node, from the cube"""
+    if index.cube is None or not node:
+        return []
+    return [{'label': node_path(child)[-1], 'value': child} for child in index.cube.child_keys(node)]
+
 @app.callback(
-    [Output('state-summary-cards', 'children'),
-     Output('state-overview-chart', 'children')],
+    [Output('district-dropdown', 'options'),
+     Output('district-dropdown', 'value'),
+     Output('rep-dropdown', 'style'),
+     Output('drill-controls', 'style')],
     Input('state-dropdown', 'value')
 )
-def update_state_overview(selected_state):
-    if not selected_state:
-        return [], []
-    
-    summary = calculate_state_summary(selected_state)
-    
-    # Summary Cards
-    cards = dbc.Row([
-        dbc.Col([
-            html.Div([
-                html.I(className="fas fa-exclamation-triangle fa-2x mb-2"),
-                html.H4(f"{summary['total_lost']}", className="mb-1"),
-                html.Small("Total Lost Customers")
-            ], className="metric-card text-center")
-        ], width=6),
-        dbc.Col([
-            html.Div([
-                html.I(className="fas fa-weight fa-2x mb-2"),
-                html.H4(f"{summary['avg_mt']}", className="mb-1"),
-                html.Small("Avg MT per Customer")
-            ], className="metric-card text-center")
-        ], width=6)
-    ])
-    
-    # Overview Chart
-    state_data = df[df['State'] == selected_state]
+@metrics.instrument
+def update_district_options(selected_state):
+    index = data_store.current
+    if index.cube is None:
+        return [], None, no_update, {'display': 'none'}
+    rep_style = {} if len(index.cube.levels) > 1 else {'display': 'none'}
+    return drill_options(index, selected_state), None, rep_style, {}
+
+@app.callback(
+    [Output('rep-dropdown', 'options'),
+     Output('rep-dropdown', 'value')],
+    Input('district-dropdown', 'value')
+)
+@metrics.instrument
+def update_rep_options(district):
+    return drill_options(data_store.current, district), None
+
+if CLIENTSIDE_CALCULATIONS:
+    @app.callback(
+        Output('recovery-basis-store', 'data'),
+        Input('drill-node', 'data'),
+        prevent_initial_call=True
+    )
+    @metrics.instrument
+    def update_node_basis(node):
+        """Adds a drill-down node's basis to the per-state one shipped with the page"""
+        index = data_store.current
+        if not node or node in index.states or node not in index:
+            raise PreventUpdate
+        basis = Patch()
+        basis[node] = node_basis(index, node)
+        return basis
+
+def build_overview_figure(index, selected_state):
+    """Pie of lost reasons and bar of priority totals for one state"""
+    with metrics.stage('pandas'):
+        state_data = index.partition(selected_state)
+        labels = state_data['Lost Reason']
+        values = state_data['Total Lost']
     
     fig = make_subplots(
         rows=1, cols=2,
@@ -495,18 +1009,18 @@ def update_state_overview(selected_state):
     # Pie chart for lost reasons
     fig.add_trace(
         go.Pie(
-            labels=state_data['Lost Reason'],
-            values=state_data['Total Lost'],
+            labels=labels,
+            values=values,
             name="Lost Customers",
             hole=0.4,
-            marker_colors=px.colors.qualitative.Set3
+            marker_colors=qualitative.Set3
         ),
         row=1, col=1
     )
     
     # Bar chart for priority distribution
-    priorities = ['P1', 'P2', 'P3', 'P4']
-    priority_totals = [state_data[p].sum() for p in priorities]
+    priorities = PRIORITIES
+    priority_totals = index.priority_totals[selected_state]
     
     fig.add_trace(
         go.Bar(
@@ -525,23 +1039,149 @@ def update_state_overview(selected_state):
         title_x=0.5
     )
     
+    return fig
+
+def state_overview_figure(index, selected_state):
+    """Overview figure, served from the shared figure cache when possible.
+    
+    Entries are the serialized figure JSON keyed by (state, data version), so
+    a hit skips both the pandas aggregation and Plotly figure construction.
+    """
+    key = f"overview:{selected_state}:{index.version}"
+    cached = figure_cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    
+    fig = build_overview_figure(index, selected_state)
+    figure_cache.set(key, fig.to_json())
+    return fig
+
+@app.callback(
+    [Output('state-summary-cards', 'children'),
+     Output('state-overview-chart', 'children')],
+    Input('drill-node', 'data')
+)
+@metrics.instrument
+def update_state_overview(selected_state):
+    index = data_store.current
+    if not selected_state or selected_state not in index:
+        return [], []
+    
+    summary = index.summary(selected_state)
+    
+    # Summary Cards
+    cards = dbc.Row([
+        dbc.Col([
+            html.Div([
+                html.I(className="fas fa-exclamation-triangle fa-2x mb-2"),
+                html.H4(f"{summary['total_lost']}", className="mb-1"),
+                html.Small("Total Lost Customers")
+            ], className="metric-card text-center")
+        ], width=6),
+        dbc.Col([
+            html.Div([
+                html.I(className="fas fa-weight fa-2x mb-2"),
+                html.H4(f"{summary['avg_mt']}", className="mb-1"),
+                html.Small("Avg MT per Customer")
+            ], className="metric-card text-center")
+        ], width=6)
+    ])
+    
+    # Overview Chart
+    fig = state_overview_figure(index, selected_state)
+    
     chart = dcc.Graph(figure=fig, config={'displayModeBar': False})
     
     return cards, dbc.Card([dbc.CardBody(chart)])
 
+def build_comparison_heatmap(index):
+    """Lost Reason x State heatmap of Total Lost for the top reasons nationally"""
+    with metrics.stage('pandas'):
+        pivot = index.lost_pivot
+        top = pivot.loc[pivot.sum(axis=1).nlargest(COMPARISON_REASONS).index]
+    
+    fig = go.Figure(go.Heatmap(
+        z=top.to_numpy(),
+        x=list(top.columns),
+        y=list(top.index),
+        colorscale='Blues',
+        hoverongaps=False,
+        colorbar=dict(title="Lost")
+    ))
+    fig.update_layout(
+        height=max(300, 30 * len(top) + 120),
+        margin=dict(l=20, r=20, t=50, b=40),
+        title_text="Lost Customers by Reason and State",
+        title_x=0.5,
+        yaxis=dict(autorange='reversed')
+    )
+    return fig
+
+def comparison_heatmap_figure(index):
+    """Comparison heatmap from the shared figure cache, keyed by data version"""
+    key = f"comparison:{COMPARISON_REASONS}:{index.version}"
+    cached = figure_cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    
+    fig = build_comparison_heatmap(index)
+    figure_cache.set(key, fig.to_json())
+    return fig
+
 @app.callback(
-    Output('state-content', 'children'),
-    Input('state-dropdown', 'value')
+    Output('state-comparison-heatmap', 'figure'),
+    Input('state-dropdown', 'options')
 )
-def update_state_content(selected_state):
-    if not selected_state:
-        return []
+@metrics.instrument
+def update_comparison_heatmap(state_options):
+    return comparison_heatmap_figure(data_store.current)
+
+def state_recovery_totals(index, slider_values):
+    """Recovery (MT/month) per state with the sliders applied by problem rank, and with all at 50%.
     
-    state_data = get_top_problems(selected_state)
-    content = []
+    Slider values are problem-major like the store: the first four apply to
+    every state's top problem, and so on; missing sliders count as 50%.
+    """
+    current, default = [], []
+    for state in index.states:
+        customers = index.top_customers[state]
+        values = list(slider_values[:customers.size]) + [None] * max(customers.size - len(slider_values), 0)
+        rates = rate_matrix(values, len(customers), len(PRIORITIES))
+        current.append(compute_recovery(customers, rates, index.avg_mt(state))['total_mt'].item())
+        default.append(compute_recovery(customers, 50, index.avg_mt(state))['total_mt'].item())
+    return current, default
+
+@app.callback(
+    Output('state-comparison-recovery', 'children'),
+    Input('state-comparison-btn', 'n_clicks'),
+    State('calculations-store', 'data')
+)
+@metrics.instrument
+def update_state_comparison(n_clicks, calculations_data):
+    index = data_store.current
+    current, default = state_recovery_totals(index, scenario_rates(load_calculations(calculations_data)))
     
-    # Priority Conversion Rates Section
-    for idx, (_, row) in enumerate(state_data.iterrows()):
+    fig = go.Figure([
+        go.Bar(x=index.states, y=current, name="Current sliders", marker_color='#2c5aa0',
+               text=[f"{value:.1f}" for value in current], textposition='outside'),
+        go.Bar(x=index.states, y=default, name="All at 50%", marker_color='#cbd5e0')
+    ])
+    fig.update_layout(
+        height=400,
+        margin=dict(l=20, r=20, t=50, b=40),
+        title_text="Recovery Potential per State (MT/month)",
+        title_x=0.5,
+        barmode='group',
+        legend=dict(orientation='h', y=-0.15)
+    )
+    return dcc.Graph(figure=fig, config={'displayModeBar': False})
+
+def problem_sections(selected_state, state_data, problems, rates):
+    """Header and priority sliders of each problem in ``problems``, at the given flat rates"""
+    sections = []
+    with metrics.stage('pandas'):
+        rows = [row for _, row in state_data.iloc[problems.start:problems.stop].iterrows()]
+    for idx, row in zip(problems, rows):
         problem = row['Lost Reason']
         
         # Problem header with metrics
@@ -561,7 +1201,7 @@ def update_state_content(selected_state):
         
         # Sliders for each priority
         slider_group = []
-        for priority in ['P1', 'P2', 'P3', 'P4']:
+        for priority_idx, priority in enumerate(PRIORITIES):
             customers = row[priority]
             slider_id = {'type': 'slider', 'state': selected_state, 'problem': idx, 'priority': priority}
             
@@ -576,7 +1216,9 @@ def update_state_content(selected_state):
                     html.Label("Conversion Rate:", className="small text-muted mb-1"),
                     dcc.Slider(
                         id=slider_id,
-                        min=0, max=100, step=5, value=50,
+                        min=0, max=100, step=SLIDER_STEP,
+                        value=rates[idx * len(PRIORITIES) + priority_idx],
+                        updatemode=SLIDER_UPDATEMODE,
                         marks={i: f"{i}%" for i in range(0, 101, 25)},
                         className="custom-slider",
                         tooltip={"placement": "bottom", "always_visible": True}
@@ -586,37 +1228,109 @@ def update_state_content(selected_state):
             
             slider_group.append(dbc.Col(slider_card, md=3))
         
-        problem_section = html.Div([
+        sections.append(html.Div([
             problem_header,
             dbc.Row(slider_group, className="g-3 mb-4")
-        ], className="priority-section")
+        ], className="priority-section"))
+    return sections
+
+def result_cards(selected_state, calculations_data, leaves, problems, avg_mt_value):
+    """Result card of each problem in ``problems``; update_calculations refreshes their leaves"""
+    cards = []
+    for idx in problems:
+        problem_calc = calculations_data['problems'][idx]
+        problem_leaves = leaves['problems'][idx]
+        rate_leaves = iter(problem_leaves['rates'])
+        mt_leaves = iter(problem_leaves['priority_mt'])
+        details = []
+        for priority_calc in problem_calc['priorities']:
+            if priority_calc['customers'] > 0:
+                leaf_id = {'state': selected_state, 'problem': idx, 'priority': priority_calc['priority']}
+                details.append(
+                    html.Div([
+                        dbc.Badge(priority_calc['priority'], color="light", text_color="dark", className="me-2"),
+                        f"{priority_calc['customers']} customers × ",
+                        html.Span(next(rate_leaves), id={'type': 'priority-rate', **leaf_id}),
+                        f" × {avg_mt_value} MT = ",
+                        html.Strong(next(mt_leaves), id={'type': 'priority-mt', **leaf_id},
+                                    className="text-warning")
+                    ], className="mb-1")
+                )
         
-        content.append(problem_section)
-    
-    # Results Section
-    results_section = []
-    for idx, (_, row) in enumerate(state_data.iterrows()):
         result_id = {'type': 'result', 'state': selected_state, 'problem': idx}
-        results_section.append(
+        cards.append(
             html.Div(
                 id=result_id,
                 className="result-card",
                 children=[
-                    html.I(className="fas fa-calculator me-2"),
-                    f"Calculating potential for: {row['Lost Reason']}..."
+                    html.Div([
+                        html.I(className="fas fa-industry me-2"),
+                        html.Strong(f"{problem_calc['name']}", className="fs-5")
+                    ], className="mb-3"),
+                    html.Div([
+                        html.I(className="fas fa-target me-2"),
+                        f"Recovery Potential: ",
+                        html.Strong(problem_leaves['total'],
+                                    id={'type': 'problem-total', 'state': selected_state, 'problem': idx},
+                                    className="fs-4 text-warning")
+                    ], className="mb-3"),
+                    html.Div(details, className="small")
                 ]
             )
         )
+    return cards
+
+@app.callback(
+    Output('state-content', 'children'),
+    Input('drill-node', 'data')
+)
+@metrics.instrument
+def update_state_content(selected_state):
+    index = data_store.current
+    if not selected_state or selected_state not in index:
+        return []
+    
+    state_data = index.top_problems(selected_state)
+    rates = [50] * (len(state_data) * len(PRIORITIES))
+    problems = page_problems(len(state_data), 1)
+    content = []
+    
+    # Only one page of problems is rendered; the rest are a page switch away
+    pages = -(-len(state_data) // PROBLEMS_PER_PAGE)
+    if pages > 1:
+        content.append(
+            dbc.Pagination(
+                id={'type': 'problem-page', 'state': selected_state},
+                max_value=pages, active_page=1,
+                first_last=True, previous_next=True, fully_expanded=False,
+                className="justify-content-center mb-3"
+            )
+        )
+    
+    # Priority Conversion Rates Section
+    content.append(html.Div(problem_sections(selected_state, state_data, problems, rates),
+                            id={'type': 'problem-sliders', 'state': selected_state}))
+    
+    # Results Section: static card layout; update_calculations only
+    # refreshes the numeric leaves (rates, MT values, totals)
+    calculations_data, leaves = cached_recovery(index, selected_state, rates)
+    results_section = [
+        html.Div(result_cards(selected_state, calculations_data, leaves, problems, index.avg_mt(selected_state)),
+                 id={'type': 'problem-results', 'state': selected_state})
+    ]
     
     # Total section
     total_id = {'type': 'total', 'state': selected_state}
     results_section.append(
         html.Div(
-            id=total_id,
             className="total-summary",
             children=[
                 html.I(className="fas fa-trophy me-3"),
-                "Total Recovery Potential will appear here"
+                f"TOTAL RECOVERY POTENTIAL: ",
+                html.Strong(leaves['total'], id=total_id, className="fs-3"),
+                html.Br(),
+                html.Small(f"for {selected_state} state" if selected_state in index.states else f"for {selected_state}",
+                           className="opacity-75")
             ]
         )
     )
@@ -633,104 +1347,422 @@ def update_state_content(selected_state):
     
     return content
 
-# Enhanced calculation callback with data storage
 @app.callback(
-    [Output({'type': 'result', 'state': ALL, 'problem': ALL}, 'children'),
-     Output({'type': 'total', 'state': ALL}, 'children'),
-     Output('calculations-store', 'data')],
-    [Input({'type': 'slider', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'value')],
-    [State('state-dropdown', 'value')]
+    [Output({'type': 'problem-sliders', 'state': MATCH}, 'children'),
+     Output({'type': 'problem-results', 'state': MATCH}, 'children')],
+    Input({'type': 'problem-page', 'state': MATCH}, 'active_page'),
+    State('calculations-store', 'data'),
+    prevent_initial_call=True
 )
-def update_calculations(slider_values, selected_state):
-    if not slider_values or not selected_state:
-        return [], [], {}
-    
-    state_data = get_top_problems(selected_state)
-    avg_mt_value = avg_mt[selected_state]
+@metrics.instrument
+def update_problem_page(page, calculations_data):
+    """Slider and result cards of another page of problems, at the rates in calculations-store"""
+    selected_state = callback_context.triggered_id['state']
+    index = data_store.current
+    if selected_state not in index:
+        raise PreventUpdate
     
-    problem_results = []
-    total_mt = 0
-    calculations_data = {'state': selected_state, 'problems': []}
-    
-    for problem_idx in range(len(state_data)):
-        row = state_data.iloc[problem_idx]
-        problem = row['Lost Reason']
-        
-        problem_sliders = slider_values[problem_idx*4:(problem_idx+1)*4]
-        
-        if len(problem_sliders) == 4:
-            problem_total = 0
-            details = []
-            problem_calc = {'name': problem, 'priorities': []}
-            
-            for i, priority in enumerate(['P1', 'P2', 'P3', 'P4']):
-                customers = row[priority]
-                conversion_rate = problem_sliders[i] if problem_sliders[i] is not None else 50
-                potential_customers = customers * (conversion_rate / 100)
-                potential_mt = potential_customers * avg_mt_value
-                problem_total += potential_mt
-                
-                priority_calc = {
-                    'priority': priority,
-                    'customers': customers,
-                    'conversion_rate': conversion_rate,
-                    'potential_customers': potential_customers,
-                    'potential_mt': potential_mt
-                }
-                problem_calc['priorities'].append(priority_calc)
-                
-                if customers > 0:
-                    details.append(
-                        html.Div([
-                            dbc.Badge(priority, color="light", text_color="dark", className="me-2"),
-                            f"{customers} customers × {conversion_rate}% × {avg_mt_value} MT = ",
-                            html.Strong(f"{potential_mt:.1f} MT", className="text-warning")
-                        ], className="mb-1")
-                    )
-            
-            total_mt += problem_total
-            problem_calc['total_mt'] = problem_total
-            calculations_data['problems'].append(problem_calc)
-            
-            result_content = [
-                html.Div([
-                    html.I(className="fas fa-industry me-2"),
-                    html.Strong(f"{problem}", className="fs-5")
-                ], className="mb-3"),
-                html.Div([
-                    html.I(className="fas fa-target me-2"),
-                    f"Recovery Potential: ",
-                    html.Strong(f"{problem_total:.1f} MT/month", className="fs-4 text-warning")
-                ], className="mb-3"),
-                html.Div(details, className="small")
-            ]
-            problem_results.append(result_content)
-    
-    calculations_data['total_mt'] = total_mt
+    state_data = index.top_problems(selected_state)
+    rates = slider_rates(index, selected_state, [], [], load_calculations(calculations_data))
+    problems = page_problems(len(state_data), page or 1)
+    calculations_data, leaves = cached_recovery(index, selected_state, rates)
+    return (problem_sections(selected_state, state_data, problems, rates),
+            result_cards(selected_state, calculations_data, leaves, problems, index.avg_mt(selected_state)))
+
+# Enhanced calculation callback with data storage. Only the numeric leaves of
+# the result cards are outputs; the card layout comes from update_state_content.
+calculation_outputs = [
+    Output({'type': 'problem-total', 'state': ALL, 'problem': ALL}, 'children'),
+    Output({'type': 'priority-rate', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'children'),
+    Output({'type': 'priority-mt', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'children'),
+    Output({'type': 'total', 'state': ALL}, 'children'),
+    Output('calculations-store', 'data')
+]
+slider_inputs = [Input({'type': 'slider', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'value')]
+
+slider_id_state = State({'type': 'slider', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'id')
+
+def update_calculations(slider_values, selected_state, slider_ids=None, previous=None):
+    """Outputs for the rendered sliders; with their ids, off-page problems keep their ``previous`` rates"""
+    index = data_store.current
+    if not slider_values or not selected_state or selected_state not in index:
+        return [], [], [], [], {}
     
-    total_content = [
-        html.I(className="fas fa-trophy me-3"),
-        f"TOTAL RECOVERY POTENTIAL: ",
-        html.Strong(f"{total_mt:.1f} MT/MONTH", className="fs-3"),
-        html.Br(),
-        html.Small(f"for {selected_state} state", className="opacity-75")
-    ]
+    rates = slider_rates(index, selected_state, slider_values, slider_ids, previous)
+    with metrics.stage('calculation'):
+        calculations_data, leaves = cached_recovery(index, selected_state, rates)
+    if slider_ids is None:
+        problems = range(len(leaves['problems']))
+    else:
+        problems = sorted({slider_id['problem'] for slider_id in slider_ids if slider_id['state'] == selected_state})
+    problem_totals, rate_leaves, mt_leaves = page_leaves(leaves, problems)
+    return problem_totals, rate_leaves, mt_leaves, [leaves['total']], store_calculations(calculations_data)
+
+if CLIENTSIDE_CALCULATIONS:
+    app.clientside_callback(
+        ClientsideFunction(namespace='recovery', function_name='update_calculations'),
+        calculation_outputs,
+        slider_inputs,
+        [State('drill-node', 'data'),
+         State('recovery-basis-store', 'data'),
+         slider_id_state,
+         State('calculations-store', 'data')]
+    )
+else:
+    # Slider changes go through a clientside coalescing step (optional
+    # debounce, per-session sequence number) before reaching the server
+    app.clientside_callback(
+        ClientsideFunction(namespace='recovery', function_name='coalesce_sliders'),
+        Output('slider-input-store', 'data'),
+        slider_inputs,
+        [State('drill-node', 'data'),
+         State('slider-settings', 'data'),
+         slider_id_state]
+    )
     
-    return problem_results, [total_content], calculations_data
+    @app.callback(calculation_outputs, Input('slider-input-store', 'data'), State('calculations-store', 'data'))
+    @metrics.instrument
+    def update_calculations_coalesced(slider_input, previous):
+        """update_calculations for the newest slider request of a session; older ones are dropped"""
+        if not slider_input:
+            raise PreventUpdate
+        session, seq = slider_input['session'], slider_input['seq']
+        if not slider_requests.register(session, seq):
+            raise PreventUpdate
+        result = update_calculations(slider_input['values'], slider_input['state'],
+                                     slider_input.get('ids'), load_calculations(previous))
+        # A newer request arrived while this one was computed
+        if not slider_requests.is_current(session, seq):
+            raise PreventUpdate
+        return result
 
-# Reset functionality
+# Reset functionality: sliders on other pages are reset through the
+# calculations-store their rates are read back from
 @app.callback(
-    Output({'type': 'slider', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'value'),
+    [Output({'type': 'slider', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'value'),
+     Output('calculations-store', 'data', allow_duplicate=True)],
     Input('reset-btn', 'n_clicks'),
     prevent_initial_call=True
 )
+@metrics.instrument
 def reset_all_sliders(n_clicks):
     if n_clicks:
         ctx = callback_context
         if ctx.triggered:
             # Get the number of sliders from the pattern-matching callback context
-            return [50] * len(ctx.outputs_list)
-    return no_update
+            return [50] * len(ctx.outputs_list[0]), {}
+    return no_update, no_update
+
+# Saved scenarios
+def scenario_owner(browser_user):
+    """Scenario owner: the proxy's user header when configured, else the browser's id"""
+    return (request.headers.get(USER_HEADER) if USER_HEADER else None) or browser_user or ''
+
+def current_problem_rates(index, selected_state, calculations_data):
+    """{problem: rates} at the current sliders; 50 for all when nothing was moved yet"""
+    if calculations_data.get('state') == selected_state:
+        return problem_rates(calculations_data)
+    names = index.top_problems(selected_state)['Lost Reason'].tolist()
+    return {name: [50] * len(PRIORITIES) for name in names}
+
+if scenario_store is not None:
+    @app.callback(
+        [Output('scenario-select', 'options'),
+         Output('scenario-select', 'value'),
+         Output('scenario-compare', 'options'),
+         Output('scenario-compare', 'value'),
+         Output('scenario-status', 'children')],
+        [Input('drill-node', 'data'),
+         Input('scenario-save-btn', 'n_clicks'),
+         Input('scenario-delete-btn', 'n_clicks')],
+        [State('scenario-name', 'value'),
+         State('scenario-select', 'value'),
+         State('calculations-store', 'data'),
+         State('scenario-user', 'data')]
+    )
+    @metrics.instrument
+    def update_scenario_list(selected_state, save_clicks, delete_clicks, name, selected, calculations_data, user):
+        """Save or delete a scenario and list the state's scenarios"""
+        index = data_store.current
+        if not selected_state or selected_state not in index:
+            return [], None, [], None, ""
+        user = scenario_owner(user)
+        trigger_id = callback_context.triggered_id
+        status, value = "", None
+        with metrics.stage('sqlite'):
+            if trigger_id == 'scenario-save-btn':
+                name = (name or "").strip()
+                if not name:
+                    raise PreventUpdate
+                rates = current_problem_rates(index, selected_state, load_calculations(calculations_data))
+                scenario_store.save(selected_state, name, rates, user)
+                status, value = f"Saved '{name}' for {selected_state}.", name
+            elif trigger_id == 'scenario-delete-btn':
+                if not selected:
+                    raise PreventUpdate
+                scenario_store.delete(selected_state, selected, user)
+                status = f"Deleted '{selected}'."
+            names = scenario_store.names(selected_state, user)
+        return names, value, names, None, status
+
+    @app.callback(
+        [Output({'type': 'slider', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'value', allow_duplicate=True),
+         Output({'type': 'problem-total', 'state': ALL, 'problem': ALL}, 'children', allow_duplicate=True),
+         Output({'type': 'priority-rate', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'children',
+                allow_duplicate=True),
+         Output({'type': 'priority-mt', 'state': ALL, 'problem': ALL, 'priority': ALL}, 'children',
+                allow_duplicate=True),
+         Output({'type': 'total', 'state': ALL}, 'children', allow_duplicate=True),
+         Output('calculations-store', 'data', allow_duplicate=True)],
+        Input('scenario-recall-btn', 'n_clicks'),
+        [State('scenario-select', 'value'),
+         State('drill-node', 'data'),
+         State('scenario-user', 'data')],
+        prevent_initial_call=True
+    )
+    @metrics.instrument
+    def recall_scenario(n_clicks, name, selected_state, user):
+        """Slider values and their results for a saved scenario, in one round trip"""
+        index = data_store.current
+        if not n_clicks or not name or not selected_state or selected_state not in index:
+            raise PreventUpdate
+        with metrics.stage('sqlite'):
+            saved = scenario_store.rates(selected_state, name, scenario_owner(user))
+        if saved is None:
+            raise PreventUpdate
+        rates = rate_vector(saved, index.top_problems(selected_state)['Lost Reason'].tolist(), len(PRIORITIES))
+        with metrics.stage('calculation'):
+            calculations_data, leaves = cached_recovery(index, selected_state, rates)
+        # Only the rendered page of sliders and result leaves is updated
+        slider_ids = [output['id'] for output in callback_context.outputs_list[0]]
+        values = [rates[slider_id['problem'] * len(PRIORITIES) + PRIORITIES.index(slider_id['priority'])]
+                  if slider_id['state'] == selected_state else no_update
+                  for slider_id in slider_ids]
+        problems = sorted({slider_id['problem'] for slider_id in slider_ids if slider_id['state'] == selected_state})
+        problem_totals, rate_leaves, mt_leaves = page_leaves(leaves, problems)
+        return (values, problem_totals, rate_leaves, mt_leaves, [leaves['total']],
+                store_calculations(calculations_data))
+
+    @app.callback(
+        Output('scenario-diff', 'children'),
+        [Input('scenario-select', 'value'),
+         Input('scenario-compare', 'value')],
+        [State('drill-node', 'data'),
+         State('scenario-user', 'data')]
+    )
+    @metrics.instrument
+    def update_scenario_diff(name_a, name_b, selected_state, user):
+        """Per-problem recovery of two saved scenarios and the change between them"""
+        index = data_store.current
+        if not name_a or not name_b or name_a == name_b or not selected_state or selected_state not in index:
+            return []
+        user = scenario_owner(user)
+        with metrics.stage('sqlite'):
+            rates_a = scenario_store.rates(selected_state, name_a, user)
+            rates_b = scenario_store.rates(selected_state, name_b, user)
+        if rates_a is None or rates_b is None:
+            return []
+        with metrics.stage('calculation'):
+            diff = scenario_diff(index.top_problems(selected_state)['Lost Reason'].tolist(),
+                                 index.top_customers[selected_state], rates_a, rates_b,
+                                 index.avg_mt(selected_state), len(PRIORITIES))
+        rows = [
+            html.Tr([
+                html.Td(row['Problem']),
+                html.Td(row['Rates A (%)']),
+                html.Td(row['Rates B (%)']),
+                html.Td(f"{row['Recovery A (MT)']:.1f}"),
+                html.Td(f"{row['Recovery B (MT)']:.1f}"),
+                html.Td(f"{row['Change (MT)']:+.1f}",
+                        className="text-success" if row['Change (MT)'] > 0 else "text-danger" if row['Change (MT)'] < 0 else None)
+            ])
+            for row in diff[diff['Rates changed'] > 0].to_dict('records')
+        ]
+        change = diff['Change (MT)'].sum()
+        table = dbc.Table([
+            html.Thead(html.Tr([html.Th("Problem"), html.Th(f"{name_a} rates (%)"), html.Th(f"{name_b} rates (%)"),
+                                html.Th(f"{name_a} (MT)"), html.Th(f"{name_b} (MT)"), html.Th("Change (MT)")])),
+            html.Tbody(rows)
+        ], bordered=True, hover=True, size="sm")
+        return [
+            html.H6(f"{name_b} vs {name_a}: {change:+.1f} MT/month ({len(rows)} of {len(diff)} problems changed)",
+                    className="mb-2"),
+            table if rows else html.P("The scenarios have the same rates.", className="text-muted")
+        ]
+
+# Lost deals history
+def build_history_figure(totals, selected_state):
+    """Stacked monthly priority counts of a state, with the all-states total on the right axis"""
+    state_totals = totals[totals['state'] == selected_state]
+    all_states = totals.groupby('month', sort=True)['total_lost'].sum()
+    
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    for priority, color in zip(PRIORITIES, ['#dc3545', '#fd7e14', '#0d6efd', '#198754']):
+        fig.add_trace(
+            go.Bar(x=state_totals['month'], y=state_totals[priority.lower()], name=priority, marker_color=color),
+            secondary_y=False
+        )
+    fig.add_trace(
+        go.Scatter(x=all_states.index, y=all_states.values, name="All states", mode='lines+markers',
+                   line=dict(color='#1a202c', dash='dot')),
+        secondary_y=True
+    )
+    fig.update_layout(
+        height=400,
+        barmode='stack',
+        margin=dict(l=20, r=20, t=50, b=40),
+        title_text=f"Lost Customers per Month: {selected_state}",
+        title_x=0.5,
+        legend=dict(orientation='h', y=-0.15)
+    )
+    fig.update_xaxes(type='category')
+    fig.update_yaxes(title_text=selected_state, secondary_y=False)
+    fig.update_yaxes(title_text="All states", secondary_y=True)
+    return fig
+
+if history is not None:
+    @app.callback(
+        [Output('history-trend', 'children'),
+         Output('history-reasons', 'children')],
+        [Input('history-range', 'start_date'),
+         Input('history-range', 'end_date'),
+         Input('state-dropdown', 'value')]
+    )
+    @metrics.instrument
+    def update_history(start_date, end_date, selected_state):
+        if not start_date or not end_date or not selected_state:
+            return html.P("No history recorded yet.", className="text-muted"), None
+        start, end = month_key(start_date), month_key(end_date)
+        
+        # Only the months in range are read; figures are cached per history generation
+        key = f"history:{selected_state}:{start}:{end}:{history.generation()}"
+        cached = figure_cache.get(key)
+        if cached is not None:
+            fig = json.loads(cached)
+        else:
+            with metrics.stage('sqlite'):
+                totals = history.monthly_totals(start, end)
+            fig = build_history_figure(totals, selected_state)
+            figure_cache.set(key, fig.to_json())
+        
+        with metrics.stage('sqlite'):
+            reasons = history.reason_totals(start, end, selected_state).head(10)
+        rows = [
+            html.Tr([
+                html.Td(row.reason),
+                html.Td(f"{row.total_lost:,}"),
+                html.Td(row.months)
+            ])
+            for row in reasons.itertuples()
+        ]
+        table = dbc.Table([
+            html.Thead(html.Tr([html.Th("Lost reason"), html.Th("Total lost"), html.Th("Months")])),
+            html.Tbody(rows)
+        ], bordered=True, hover=True, size="sm")
+        
+        return (dcc.Graph(figure=fig, config={'displayModeBar': False}),
+                [html.H6(f"🔝 Top lost reasons, {start} to {end}:", className="mb-2"), table])
+
+# What-if sweep
+def format_scenario_rates(rates):
+    """Grid rates are one list per priority; Monte Carlo rates one list per problem"""
+    if rates and isinstance(rates[0], list):
+        return "; ".join(f"#{idx + 1}: " + "/".join(str(r) for r in problem) + "%"
+                         for idx, problem in enumerate(rates))
+    return " · ".join(f"{priority} {rate}%" for priority, rate in zip(PRIORITIES, rates))
+
+def sweep_results(state_result):
+    """Histogram, percentiles and top scenarios of one state's sweep"""
+    dist = state_result['distribution']
+    edges = dist['histogram']['edges']
+    fig = go.Figure(go.Bar(
+        x=[(lo + hi) / 2 for lo, hi in zip(edges, edges[1:])],
+        y=dist['histogram']['counts'],
+        width=edges[1] - edges[0] if len(edges) > 1 else None,
+        marker_color='#2c5aa0'
+    ))
+    fig.update_layout(
+        height=300,
+        margin=dict(l=40, r=20, t=40, b=40),
+        title_text=f"Recovery potential over {dist['scenarios']:,} scenarios",
+        xaxis_title="MT/month",
+        yaxis_title="Scenarios",
+        bargap=0
+    )
+    
+    percentiles = [
+        dbc.Badge(f"{name.upper()}: {value:.1f} MT", color="light", text_color="dark", className="me-2")
+        for name, value in dist['percentiles'].items()
+    ]
+    rows = [
+        html.Tr([
+            html.Td(rank + 1),
+            html.Td(format_scenario_rates(scenario['rates'])),
+            html.Td(f"{scenario['mean_rate']:.1f}%"),
+            html.Td(f"{scenario['total_mt']:.1f} MT/month")
+        ])
+        for rank, scenario in enumerate(state_result['top'])
+    ]
+    table = dbc.Table([
+        html.Thead(html.Tr([html.Th("#"), html.Th("Conversion rates"), html.Th("Avg rate"),
+                            html.Th("Recovery potential")])),
+        html.Tbody(rows)
+    ], bordered=True, hover=True, size="sm", className="mt-3")
+    
+    return [
+        dcc.Graph(figure=fig, config={'displayModeBar': False}),
+        html.Div(percentiles, className="mb-2"),
+        html.H6("🏆 Top scenarios within the rate budget:", className="mt-3") if rows else
+        html.P("No scenario fits the rate budget.", className="text-muted"),
+        table if rows else None
+    ]
+
+@app.callback(
+    Output('sweep-results', 'children'),
+    Input('sweep-btn', 'n_clicks'),
+    [State('state-dropdown', 'value'),
+     State('sweep-mode', 'value'),
+     State('sweep-samples', 'value'),
+     State('sweep-budget', 'value')],
+    prevent_initial_call=True
+)
+@metrics.instrument
+def run_state_sweep(n_clicks, selected_state, mode, samples, budget):
+    index = data_store.current
+    if not selected_state or selected_state not in index:
+        return no_update
+    try:
+        result = run_sweep(index, [selected_state], mode=mode, samples=int(samples or 100000),
+                           top_n=SWEEP_TOP_N, max_mean_rate=budget)
+    except ValueError as exc:
+        return dbc.Alert(str(exc), color="danger")
+    return sweep_results(result['states'][selected_state])
+
+# Debug overlay with the per-callback metrics of this worker; not instrumented itself
+if METRICS:
+    @app.callback(
+        Output('metrics-overlay', 'children'),
+        Input('metrics-interval', 'n_intervals')
+    )
+    def update_metrics_overlay(n_intervals):
+        rows = [
+            html.Tr([
+                html.Td(row['callback']),
+                html.Td(row['calls']),
+                html.Td(f"{row['avg_ms']:.1f}"),
+                html.Td(f"{row['max_ms']:.1f}"),
+                html.Td(f"{row['compute_ms']:.1f}"),
+                html.Td(f"{row['stages_ms'].get('pandas', 0):.1f}"),
+                html.Td(f"{row['serialize_ms']:.1f}"),
+                html.Td(f"{row['avg_bytes'] / 1024:.1f}")
+            ])
+            for row in metrics.snapshot()
+        ]
+        return dbc.Table([
+            html.Thead(html.Tr([html.Th(h) for h in
+                                ["callback", "calls", "avg ms", "max ms", "compute", "pandas", "serialize", "KiB"]])),
+            html.Tbody(rows)
+        ], size="sm", className="mb-0")
 
 # Export functionality
 @app.callback(
@@ -739,9 +1771,10 @@ def reset_all_sliders(n_clicks):
     [Input('export-btn', 'n_clicks'),
      Input('close-export', 'n_clicks')],
     [State('calculations-store', 'data'),
-     State('state-dropdown', 'value')],
+     State('drill-node', 'data')],
     prevent_initial_call=True
 )
+@metrics.instrument
 def handle_export(export_clicks, close_clicks, calculations_data, selected_state):
     ctx = callback_context
     if not ctx.triggered:
@@ -752,18 +1785,12 @@ def handle_export(export_clicks, close_clicks, calculations_data, selected_state
     if trigger_id == 'close-export':
         return False, ""
     
+    calculations_data = load_calculations(calculations_data)
     if trigger_id == 'export-btn' and calculations_data:
-        export_data = generate_export_data(selected_state, calculations_data)
+        # Files are generated by the /export route only when a link is clicked
+        rates = scenario_rates(calculations_data)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
-        # Create JSON download
-        json_string = json.dumps(export_data, indent=2)
-        json_encoded = base64.b64encode(json_string.encode()).decode()
-        
-        # Create Excel download
-        excel_buffer = create_excel_export(selected_state, calculations_data)
-        excel_encoded = base64.b64encode(excel_buffer.getvalue()).decode()
-        
         download_content = [
             html.Div([
                 html.I(className="fas fa-check-circle text-success me-2", style={'fontSize': '24px'}),
@@ -809,8 +1836,8 @@ def handle_export(export_clicks, close_clicks, calculations_data, selected_state
                                     dbc.Button([
                                         html.I(className="fas fa-download me-2"),
                                         "Download Excel"
-                                    ], color="success", block=True),
-                                    href=f"data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{excel_encoded}",
+                                    ], color="success", className="w-100"),
+                                    href=export_url(selected_state, rates, 'xlsx'),
                                     download=f"recovery_analysis_{selected_state}_{timestamp}.xlsx"
                                 )
                             ], className="text-center")
@@ -831,8 +1858,8 @@ def handle_export(export_clicks, close_clicks, calculations_data, selected_state
                                     dbc.Button([
                                         html.I(className="fas fa-download me-2"),
                                         "Download JSON"
-                                    ], color="primary", block=True),
-                                    href=f"data:application/json;charset=utf-8;base64,{json_encoded}",
+                                    ], color="primary", className="w-100"),
+                                    href=export_url(selected_state, rates, 'json'),
                                     download=f"recovery_analysis_{selected_state}_{timestamp}.json"
                                 )
                             ], className="text-center")
@@ -841,10 +1868,31 @@ def handle_export(export_clicks, close_clicks, calculations_data, selected_state
                 ], md=6)
             ], className="g-3"),
             
+            # Streamed, for downstream pipelines
+            dbc.Card([
+                dbc.CardBody([
+                    html.H5([html.I(className="fas fa-database text-secondary me-2"), "Data Files"]),
+                    html.P("Detailed analysis and raw state rows as CSV" +
+                           (" or Parquet" if parquet_available() else ""),
+                           className="text-muted small"),
+                    html.Div([
+                        html.A(
+                            dbc.Button([html.I(className="fas fa-download me-2"), label],
+                                       color="secondary", outline=True, size="sm"),
+                            href=export_url(selected_state, rates, fmt, dataset),
+                            className="me-2"
+                        )
+                        for fmt in (['csv', 'parquet'] if parquet_available() else ['csv'])
+                        for dataset, label in (('analysis', f"Analysis {fmt.upper()}"),
+                                               ('raw', f"Raw Data {fmt.upper()}"))
+                    ])
+                ])
+            ], className="mt-3"),
+            
             html.Hr(className="my-4"),
             html.Small([
                 html.I(className="fas fa-info-circle me-1"),
-                f"Reports generated on {export_data['timestamp']}"
+                f"Reports are generated when downloaded (prepared {datetime.now().strftime('%Y-%m-%d %H:%M:%S')})"
             ], className="text-muted")
         ]
         
@@ -852,7 +1900,229 @@ def handle_export(export_clicks, close_clicks, calculations_data, selected_state
     
     return False, ""
 
+# Multi-state export jobs
+@app.callback(
+    Output('export-job-store', 'data'),
+    [Input('export-selected-btn', 'n_clicks'),
+     Input('export-all-btn', 'n_clicks')],
+    [State('export-states', 'value'),
+     State('calculations-store', 'data')],
+    prevent_initial_call=True
+)
+@metrics.instrument
+def start_export_job(selected_clicks, all_clicks, selected_states, calculations_data):
+    ctx = callback_context
+    if not ctx.triggered:
+        return no_update
+    
+    index = data_store.current
+    trigger_id = ctx.triggered[0]['prop_id'].split('.')[0]
+    states = index.states if trigger_id == 'export-all-btn' else (selected_states or [])
+    if not states:
+        return no_update
+    
+    # Every state is evaluated at the current slider setting
+    rates = scenario_rates(load_calculations(calculations_data)) or [50] * (index.top_n * len(PRIORITIES))
+    return {'job_id': export_jobs.submit(index, states, rates)}
+
+@app.callback(
+    [Output('export-job-progress', 'value'),
+     Output('export-job-progress', 'label'),
+     Output('export-job-status', 'children'),
+     Output('export-job-interval', 'disabled')],
+    [Input('export-job-interval', 'n_intervals'),
+     Input('export-job-store', 'data')],
+    prevent_initial_call=True
+)
+@metrics.instrument
+def poll_export_job(n_intervals, job):
+    if not job:
+        return 0, "", "", True
+    
+    status = export_jobs.status(job['job_id'])
+    if status is None:
+        return 0, "", html.Small("Export job not found", className="text-danger"), True
+    
+    # Preparing and writing a state count half each
+    progress = int(50 * (status['done'] + status.get('written', 0)) / status['total']) if status['total'] else 100
+    if status['status'] == 'failed':
+        return progress, "", html.Small(f"Export failed: {status.get('error', '')}", className="text-danger"), True
+    if status['status'] == 'running':
+        message = html.Small(f"Prepared {status['done']}, written {status.get('written', 0)} of "
+                             f"{status['total']} states...", className="text-muted")
+        return progress, f"{progress}%", message, False
+    
+    link = html.A(
+        dbc.Button([
+            html.I(className="fas fa-download me-2"),
+            f"Download Workbook ({status['total']} states)"
+        ], color="success"),
+        href=app.get_relative_path(f"/export/jobs/{job['job_id']}.xlsx")
+    )
+    return 100, "100%", link, True
+
 server = app.server
+metrics.install(server)
+
+# --- Export downloads ---
+EXPORT_MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'json': 'application/json'
+}
+
+# Renderers get the index snapshot the request saw: a reload landing during
+# a render must not put new data under the old version's key
+def render_xlsx(state, version, rates, index, stage):
+    with stage('calculation'):
+        calculations_data, _ = cached_recovery(index, state, list(rates))
+    with stage('xlsx'):
+        return create_excel_export(state, calculations_data, index).getvalue()
+
+def render_json(state, version, rates, index, stage):
+    with stage('calculation'):
+        calculations_data, _ = cached_recovery(index, state, list(rates))
+    with stage('json'):
+        return dumps(generate_export_data(state, calculations_data, index))
+
+# A download renders both formats of its scenario concurrently; the other
+# one is kept, within EXPORT_CACHE_MB, until its link is clicked
+export_pipeline = ExportPipeline({'xlsx': render_xlsx, 'json': render_json},
+                                 max_bytes=int(EXPORT_CACHE_MB * 1024 * 1024))
+
+def export_rates():
+    """Scenario rates from the ``rates`` query argument; 400 when malformed"""
+    try:
+        rates = tuple(int(r) for r in request.args.get('rates', '').split(','))
+    except ValueError:
+        abort(400)
+    if any(r < 0 or r > 100 for r in rates):
+        abort(400)
+    return rates
+
+@server.route('/export/<state>.<fmt>')
+def download_export(state, fmt):
+    index = data_store.current
+    if fmt not in EXPORT_MIMETYPES or state not in index:
+        abort(404)
+    rates = export_rates()
+    
+    payload, timings = export_pipeline.result((state, index.version, rates), fmt, index)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    response = send_file(BytesIO(payload), mimetype=EXPORT_MIMETYPES[fmt], as_attachment=True,
+                         download_name=f"recovery_analysis_{state}_{timestamp}.{fmt}")
+    response.headers['Server-Timing'] = server_timing(timings)
+    return response
+
+def attachment(download_name):
+    """Content-Disposition options for ``download_name``, as send_file sets them.
+
+    Drill-down node names are not latin-1, so those get an ASCII
+    ``filename`` plus the UTF-8 ``filename*`` (RFC 6266).
+    """
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+-.^_`|~')}"}
+    return {'filename': download_name}
+
+@server.route('/export/<state>/<dataset>.<fmt>')
+def stream_export(state, dataset, fmt):
+    """Detailed analysis or raw state rows as CSV/Parquet, streamed chunk by chunk"""
+    index = data_store.current
+    if fmt not in STREAM_FORMATS or dataset not in DATASETS or state not in index:
+        abort(404)
+    if fmt == 'parquet' and not parquet_available():
+        abort(404)
+    if dataset == 'analysis':
+        calculations_data, _ = calculate_recovery(index, state, list(export_rates()))
+        frames = analysis_frames(state, calculations_data)
+    else:
+        # Rows come from this request's index snapshot, even if a reload
+        # swaps in a new one while the response is streaming
+        frames = raw_frames(index.partition(state))
+    chunks = iter_csv(frames) if fmt == 'csv' else iter_parquet(frames)
+    
+    response = Response(chunks, mimetype=STREAM_FORMATS[fmt])
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    response.headers.set('Content-Disposition', 'attachment',
+                         **attachment(f"recovery_{dataset}_{state}_{timestamp}.{fmt}"))
+    return response
+
+# --- What-if sweep API ---
+def sweep_options(params):
+    """run_sweep keyword arguments from a JSON request body; ValueError on bad input"""
+    options = {
+        'mode': str(params.get('mode', 'grid')),
+        'step': int(params.get('step', 5)),
+        'low': int(params.get('low', 0)),
+        'high': int(params.get('high', 100)),
+        'samples': int(params.get('samples', 100000)),
+        'top_n': int(params.get('top_n', SWEEP_TOP_N)),
+        'max_mean_rate': params.get('max_mean_rate'),
+        'seed': params.get('seed')
+    }
+    if options['max_mean_rate'] is not None:
+        options['max_mean_rate'] = float(options['max_mean_rate'])
+    if options['seed'] is not None:
+        options['seed'] = int(options['seed'])
+    if options['top_n'] < 0:
+        raise ValueError("top_n must not be negative")
+    return options
+
+@server.route('/api/sweep', methods=['POST'])
+def sweep_api():
+    """Batch what-if sweep; JSON body with ``states`` (default: all) and run_sweep options"""
+    params = request.get_json(silent=True) or {}
+    if not isinstance(params, dict):
+        abort(400)
+    index = data_store.current
+    states = params.get('states') or index.states
+    if not isinstance(states, list) or not all(isinstance(state, str) for state in states):
+        abort(400)
+    if any(state not in index for state in states):
+        abort(404)
+    try:
+        return run_sweep(index, states, **sweep_options(params))
+    except (TypeError, ValueError):
+        abort(400)
+
+def require_stats_token():
+    """404 unless the request carries the configured RECOVERY_STATS_TOKEN"""
+    if not STATS_TOKEN or not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                  f'Bearer {STATS_TOKEN}'):
+        abort(404)
+
+@server.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text for the callback metrics"""
+    require_stats_token()
+    if not METRICS:
+        abort(404)
+    caches = {'figures': figure_cache, 'calculations': calculation_cache}
+    if session_store is not None:
+        caches['sessions'] = session_store
+    return metrics.prometheus_text(caches), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@server.route('/cache-stats')
+def cache_stats():
+    require_stats_token()
+    stats = {'figures': figure_cache.stats(), 'calculations': calculation_cache.stats(),
+             'exports': export_pipeline.stats(), 'slider_requests_discarded': slider_requests.discarded}
+    if session_store is not None:
+        stats['sessions'] = session_store.stats()
+    return stats
+
+@server.route('/export/jobs/<job_id>.xlsx')
+def download_export_job(job_id):
+    path = export_jobs.workbook_path(job_id)
+    if not job_id.isalnum() or not os.path.exists(path):
+        abort(404)
+    
+    status = export_jobs.status(job_id) or {}
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return send_file(path, mimetype=EXPORT_MIMETYPES['xlsx'], as_attachment=True,
+                     download_name=f"recovery_analysis_{status.get('total', 0)}_states_{timestamp}.xlsx")
 
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,171 @@
+// Clientside recovery-potential math, mirroring calculate_recovery in app.py.
+// Used when RECOVERY_CLIENTSIDE_CALCULATIONS is enabled: slider drags are
+// computed in the browser from the per-state basis shipped once in
+// 'recovery-basis-store', and calculations-store only reaches the server
+// when an export is requested. Otherwise coalesce_sliders debounces and
+// numbers slider changes on their way to the server.
+(function () {
+    var PRIORITIES = ['P1', 'P2', 'P3', 'P4'];
+    // cube.NODE_SEPARATOR
+    var NODE_SEPARATOR = ' › ';
+
+    // Match Python's '{:.1f}': exact binary ties (quarters such as 32.25)
+    // round half to even, where toFixed would round them up
+    function fixed1(value) {
+        var quarters = value * 4;
+        if (Number.isInteger(quarters) && quarters % 2 !== 0) {
+            var tenths = Math.floor(value * 10);
+            if (tenths % 2 !== 0) {
+                tenths += 1;
+            }
+            return (tenths / 10).toFixed(1);
+        }
+        return value.toFixed(1);
+    }
+
+    // Flat rates (problem-major) for all of the state's top problems,
+    // mirroring slider_rates in app.py: sliders by id, other problems keep
+    // their rate from the previous calculations-store payload, or 50
+    function sliderRates(sliderValues, selectedState, count, sliderIds, previous) {
+        if (!sliderIds) {
+            return sliderValues.slice();
+        }
+        var rates = [];
+        if (previous && previous.state === selectedState && previous.problems) {
+            previous.problems.forEach(function (problem) {
+                problem.priorities.forEach(function (priority) {
+                    rates.push(priority.conversion_rate);
+                });
+            });
+        }
+        if (rates.length !== count) {
+            rates = [];
+            for (var r = 0; r < count; r++) {
+                rates.push(50);
+            }
+        }
+        sliderIds.forEach(function (id, k) {
+            if (id.state !== selectedState) {
+                return;
+            }
+            var position = id.problem * PRIORITIES.length + PRIORITIES.indexOf(id.priority);
+            if (position < count) {
+                rates[position] = sliderValues[k];
+            }
+        });
+        return rates;
+    }
+
+    function updateCalculations(sliderValues, selectedState, basis, sliderIds, previous) {
+        var stateBasis = basis && basis[selectedState];
+        if (!sliderValues || !sliderValues.length || !stateBasis) {
+            return [[], [], [], [], {}];
+        }
+        var avgMt = stateBasis.avg_mt;
+        var sliderRateValues = sliderRates(sliderValues, selectedState,
+                                           stateBasis.problems.length * PRIORITIES.length, sliderIds, previous);
+        var problems = Math.min(stateBasis.problems.length, Math.floor(sliderRateValues.length / 4));
+        // Leaves are returned for the rendered page of problems only
+        var shown = {};
+        (sliderIds || []).forEach(function (id) {
+            if (id.state === selectedState) {
+                shown[id.problem] = true;
+            }
+        });
+        var problemTotals = [];
+        var rates = [];
+        var priorityMt = [];
+        var totalMt = 0;
+        var calculations = {state: selectedState, problems: []};
+
+        for (var p = 0; p < problems; p++) {
+            var problemTotal = 0;
+            var problemCalc = {name: stateBasis.problems[p], priorities: []};
+            var visible = !sliderIds || shown[p];
+
+            for (var i = 0; i < PRIORITIES.length; i++) {
+                var customers = stateBasis.customers[p][i];
+                var rate = sliderRateValues[p * 4 + i];
+                if (rate === null || rate === undefined) {
+                    rate = 50;
+                }
+                var potentialCustomers = customers * (rate / 100);
+                var potentialMt = potentialCustomers * avgMt;
+                problemTotal += potentialMt;
+
+                problemCalc.priorities.push({
+                    priority: PRIORITIES[i],
+                    customers: customers,
+                    conversion_rate: rate,
+                    potential_customers: potentialCustomers,
+                    potential_mt: potentialMt
+                });
+
+                // Leaves exist only for priorities with lost customers
+                if (visible && customers > 0) {
+                    rates.push(rate + '%');
+                    priorityMt.push(fixed1(potentialMt) + ' MT');
+                }
+            }
+
+            totalMt += problemTotal;
+            problemCalc.total_mt = problemTotal;
+            calculations.problems.push(problemCalc);
+            if (visible) {
+                problemTotals.push(fixed1(problemTotal) + ' MT/month');
+            }
+        }
+
+        calculations.total_mt = totalMt;
+
+        return [problemTotals, rates, priorityMt, [fixed1(totalMt) + ' MT/MONTH'], calculations];
+    }
+
+    // Slider changes of this page, numbered so the server can drop
+    // superseded requests (see coalesce.py)
+    var sliderSeq = 0;
+
+    // Forward slider values to 'slider-input-store'. With a debounce window,
+    // only the last change within the window is forwarded; earlier ones
+    // resolve to no_update.
+    function coalesceSliders(sliderValues, selectedState, settings, sliderIds) {
+        var seq = ++sliderSeq;
+        var payload = {
+            state: selectedState,
+            values: sliderValues || [],
+            ids: sliderIds || [],
+            session: settings && settings.session,
+            seq: seq
+        };
+        var wait = (settings && settings.debounce_ms) || 0;
+        if (wait <= 0) {
+            return payload;
+        }
+        return new Promise(function (resolve) {
+            setTimeout(function () {
+                resolve(seq === sliderSeq ? payload : window.dash_clientside.no_update);
+            }, wait);
+        });
+    }
+
+    // Drill-down node key from the state, district and rep dropdowns. A
+    // district or rep left over from another state (the dropdowns are reset
+    // by a server round trip) is ignored.
+    function drillNode(state, district, rep) {
+        if (!state || !district || district.indexOf(state + NODE_SEPARATOR) !== 0) {
+            return state || null;
+        }
+        if (rep && rep.indexOf(district + NODE_SEPARATOR) === 0) {
+            return rep;
+        }
+        return district;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        recovery: {
+            update_calculations: updateCalculations,
+            coalesce_sliders: coalesceSliders,
+            drill_node: drillNode
+        }
+    });
+})();
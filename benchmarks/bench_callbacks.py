@@ -0,0 +1,316 @@
+"""p50/p99 latency and throughput of the dashboard callbacks under load.
+
+    python -m benchmarks.bench_callbacks --states 5 --reasons 2000
+    python -m benchmarks.bench_callbacks --save baseline.json
+    python -m benchmarks.bench_callbacks --compare baseline.json   # exit 1 on regression
+
+Requests are the /_dash-update-component payloads the browser sends:
+state selection (overview, content), a slider-drag trace (calculations),
+reset and the export modal, plus the /export download route. By default
+they run in-process through the Flask test client on a synthetic table
+of ``--states`` x ``--reasons``. The export writer (create_excel_export)
+is also timed directly. With --url they go to a running server instead;
+start it on the same data with --write-csv and RECOVERY_DATA_SOURCE.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+from benchmarks.synthetic import make_lost_deals, make_slider_trace
+from data_store import TOP_PROBLEMS
+
+DISPATCH = '/_dash-update-component'
+
+
+class Client:
+    """POST/GET against the app in-process (Flask test client) or a server at ``url``"""
+
+    def __init__(self, url=None, server=None):
+        self.url = url.rstrip('/') if url else None
+        self.test_client = server.test_client() if server is not None else None
+
+    def get(self, path):
+        if self.test_client is not None:
+            response = self.test_client.get(path)
+            return response.status_code, response.get_data()
+        with urllib.request.urlopen(self.url + path) as response:
+            return response.status, response.read()
+
+    def post(self, body):
+        data = json.dumps(body).encode()
+        if self.test_client is not None:
+            response = self.test_client.post(DISPATCH, data=data, content_type='application/json')
+            return response.status_code, response.get_data()
+        request = urllib.request.Request(self.url + DISPATCH, data=data,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read()
+
+
+def find_ids(node, type_):
+    """Pattern-matching ids of ``type_`` in a serialized component tree"""
+    found = []
+    if isinstance(node, dict):
+        props = node.get('props', {})
+        if isinstance(props.get('id'), dict) and props['id'].get('type') == type_:
+            found.append(props['id'])
+        for value in props.values():
+            found.extend(find_ids(value, type_))
+    elif isinstance(node, list):
+        for item in node:
+            found.extend(find_ids(item, type_))
+    return found
+
+
+def callback_outputs(client):
+    """Output strings of the server-side callbacks, as listed in /_dash-dependencies"""
+    _, body = client.get('/_dash-dependencies')
+    return [dep['output'] for dep in json.loads(body) if not dep.get('clientside_function')]
+
+
+def output_key(outputs, fragment):
+    """Output string of the first callback whose first output contains ``fragment``"""
+    matches = [output for output in outputs if fragment in output.split('...')[0]]
+    return matches[0] if matches else None
+
+
+def drill_node(state):
+    return {'id': 'drill-node', 'property': 'data', 'value': state}
+
+
+class Scenario:
+    """Callback payloads for one dataset, built from the app's own responses"""
+
+    def __init__(self, client, states, trace):
+        self.client = client
+        self.states = states
+        self.trace = trace
+        self.outputs = callback_outputs(client)
+        # One page session per run; trace events are its numbered slider changes
+        self.session = f"bench-{os.getpid()}-{time.time_ns()}"
+        self.content = {}
+        for state in states:
+            status, body = client.post(self.content_request(state))
+            assert status == 200, status
+            self.content[state] = json.loads(body)['response']['state-content']['children']
+
+    def overview_request(self, state):
+        return {
+            'output': output_key(self.outputs, 'state-summary-cards.children'),
+            'outputs': [{'id': 'state-summary-cards', 'property': 'children'},
+                        {'id': 'state-overview-chart', 'property': 'children'}],
+            'inputs': [drill_node(state)], 'changedPropIds': ['drill-node.data']
+        }
+
+    def content_request(self, state):
+        return {
+            'output': output_key(self.outputs, 'state-content.children'),
+            'outputs': {'id': 'state-content', 'property': 'children'},
+            'inputs': [drill_node(state)], 'changedPropIds': ['drill-node.data']
+        }
+
+    def calculations_request(self, state, sliders, seq):
+        """Coalesced slider payload, as forwarded by the clientside coalesce_sliders step"""
+        tree = self.content[state]
+        outputs = [[{'id': leaf, 'property': 'children'} for leaf in find_ids(tree, leaf_type)]
+                   for leaf_type in ('problem-total', 'priority-rate', 'priority-mt', 'total')]
+        outputs.append({'id': 'calculations-store', 'property': 'data'})
+        ids = find_ids(tree, 'slider')
+        values = sliders[:len(ids)]
+        return {
+            'output': output_key(self.outputs, 'problem-total'),
+            'outputs': outputs,
+            'inputs': [{'id': 'slider-input-store', 'property': 'data',
+                        'value': {'state': state, 'values': values, 'ids': ids[:len(values)],
+                                  'session': self.session, 'seq': seq}}],
+            'state': [{'id': 'calculations-store', 'property': 'data', 'value': None}],
+            'changedPropIds': ['slider-input-store.data']
+        }
+
+    def reset_request(self, state):
+        return {
+            'output': output_key(self.outputs, '"type":"slider"'),
+            'outputs': [[{'id': slider, 'property': 'value'} for slider in find_ids(self.content[state], 'slider')],
+                        {'id': 'calculations-store', 'property': 'data'}],
+            'inputs': [{'id': 'reset-btn', 'property': 'n_clicks', 'value': 1}],
+            'changedPropIds': ['reset-btn.n_clicks']
+        }
+
+    def export_modal_request(self, state, calculations):
+        return {
+            'output': output_key(self.outputs, 'export-modal.is_open'),
+            'outputs': [{'id': 'export-modal', 'property': 'is_open'},
+                        {'id': 'export-modal-body', 'property': 'children'}],
+            'inputs': [{'id': 'export-btn', 'property': 'n_clicks', 'value': 1},
+                       {'id': 'close-export', 'property': 'n_clicks', 'value': 0}],
+            'state': [{'id': 'calculations-store', 'property': 'data', 'value': calculations}, drill_node(state)],
+            'changedPropIds': ['export-btn.n_clicks']
+        }
+
+    def phases(self, repeat):
+        """(name, [request thunk]) per benchmarked callback or route"""
+        client = self.client
+        post = client.post
+        state_cycle = self.states * repeat
+        phases = [
+            ('update_state_overview', [lambda s=s: post(self.overview_request(s)) for s in state_cycle]),
+            ('update_state_content', [lambda s=s: post(self.content_request(s)) for s in state_cycle]),
+        ]
+        # Absent when the server runs the calculations clientside
+        serverside = output_key(self.outputs, 'problem-total') is not None
+        if serverside:
+            phases.append(('update_calculations', [
+                lambda e=e, seq=seq: post(self.calculations_request(e['state'], e['sliders'], seq))
+                for seq, e in enumerate(self.trace, start=1)]))
+        phases.append(('reset_all_sliders', [lambda s=s: post(self.reset_request(s)) for s in state_cycle]))
+        last = {event['state']: event['sliders'] for event in self.trace}
+        calculations = {state: {'state': state, 'problems': [], 'total_mt': 0} for state in self.states}
+        for state in self.states if serverside else []:
+            sliders = last.get(state, [50] * len(find_ids(self.content[state], 'slider')))
+            _, body = post(self.calculations_request(state, sliders, len(self.trace) + 1))
+            calculations[state] = json.loads(body)['response']['calculations-store']['data']
+        phases.append(('handle_export', [
+            lambda s=s: post(self.export_modal_request(s, calculations[s])) for s in state_cycle]))
+        phases.append(('/export/<state>.xlsx', [
+            lambda e=e: client.get(f"/export/{e['state']}.xlsx?rates=" +
+                                   ','.join(str(v) for v in e['sliders'][:len(find_ids(self.content[e['state']], 'slider'))]))
+            for e in self.trace[:repeat * len(self.states)]]))
+        return phases, calculations
+
+
+def run_phase(requests, concurrency):
+    """Latencies (s) of ``requests`` run on ``concurrency`` threads, and the phase wall time"""
+    def timed(request):
+        start = time.perf_counter()
+        status, _ = request()
+        # 204: the server dropped a superseded slider request
+        if status not in (200, 204):
+            raise RuntimeError(f"HTTP {status}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(timed, requests))
+    else:
+        latencies = [timed(request) for request in requests]
+    return latencies, time.perf_counter() - start
+
+
+def summarize(latencies, wall):
+    latencies = np.asarray(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'mean_ms': float(latencies.mean() * 1000),
+        'throughput': len(latencies) / wall if wall else 0.0
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Names whose p50 or p99 grew by more than ``tolerance`` over ``baseline``"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if result[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {old[metric]:.1f} -> {result[metric]:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--states', type=int, default=5)
+    parser.add_argument('--reasons', type=int, default=2000, help='lost reasons (rows) per state')
+    parser.add_argument('--drags', type=int, default=40, help='slider drags in the generated trace')
+    parser.add_argument('--trace', help='replay a recorded slider trace (JSON) instead of generating one')
+    parser.add_argument('--record-trace', help='write the slider trace used to this file')
+    parser.add_argument('--repeat', type=int, default=10, help='state-selection requests per state')
+    parser.add_argument('--export-repeat', type=int, default=3, help='direct create_excel_export runs per state')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help='benchmark a running server instead of the app in-process')
+    parser.add_argument('--write-csv', help='write the synthetic table to this CSV and exit')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline results JSON; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50/p99 growth over --compare')
+    args = parser.parse_args()
+
+    frame = make_lost_deals(states=args.states, rows_per_state=args.reasons, seed=args.seed)
+    if args.write_csv:
+        frame.to_csv(args.write_csv, index=False)
+        return
+
+    if args.url:
+        client = Client(url=args.url)
+        app = None
+    else:
+        # Fresh caches so repeated runs start from the same state
+        os.environ.setdefault('RECOVERY_CACHE_DIR', tempfile.mkdtemp(prefix='bench-callbacks-'))
+        import app
+        from data_loader import compact_frame
+
+        app.data_store.rebuild(compact_frame(frame) if app.COMPACT_DATA else frame)
+        client = Client(server=app.server)
+
+    states = list(dict.fromkeys(frame['State']))
+    if args.trace:
+        with open(args.trace) as fh:
+            trace = json.load(fh)
+    else:
+        trace = make_slider_trace(states, TOP_PROBLEMS, args.drags, args.seed)
+    if args.record_trace:
+        with open(args.record_trace, 'w') as fh:
+            json.dump(trace, fh)
+
+    scenario = Scenario(client, states, trace)
+    phases, calculations = scenario.phases(args.repeat)
+    results = {}
+    for name, requests in phases:
+        results[name] = summarize(*run_phase(requests, args.concurrency))
+
+    if app is not None:
+        latencies = []
+        start = time.perf_counter()
+        for state in states * args.export_repeat:
+            export_start = time.perf_counter()
+            app.create_excel_export(state, calculations[state])
+            latencies.append(time.perf_counter() - export_start)
+        results['create_excel_export'] = summarize(latencies, time.perf_counter() - start)
+
+    print(f"{args.states} states x {args.reasons} reasons, {len(trace)} trace events, "
+          f"concurrency {args.concurrency}")
+    print(f"{'callback':<24}{'requests':>10}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['requests']:>10}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+              f"{result['throughput']:>10.1f}")
+
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump({'args': vars(args), 'results': results}, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        settings = ('states', 'reasons', 'drags', 'trace', 'repeat', 'concurrency', 'seed', 'url')
+        changed = [key for key in settings if baseline['args'].get(key) != getattr(args, key)]
+        if changed:
+            print(f"warning: baseline ran with different {', '.join(changed)}")
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
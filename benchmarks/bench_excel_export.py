@@ -0,0 +1,48 @@
+"""Rows/sec of the Excel export paths on a large synthetic state.
+
+    python -m benchmarks.bench_excel_export --rows 100000 --legacy-rows 10000
+
+The pandas path (to_excel followed by per-cell rewrites) is much slower,
+so it runs on its own, smaller state by default.
+"""
+import argparse
+import time
+
+import app
+from benchmarks.synthetic import make_lost_deals
+
+
+def time_export(export, rows, repeat):
+    frame = make_lost_deals(states=1, rows_per_state=rows)
+    app.data_store.rebuild(frame)
+    state = app.data_store.current.states[0]
+    calculations_data, _ = app.calculate_recovery(app.data_store.current, state, [50] * 12)
+    best = float('inf')
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(export(state, calculations_data).getvalue())
+        best = min(best, time.perf_counter() - start)
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='rows in the state for the fast path')
+    parser.add_argument('--legacy-rows', type=int, default=10000,
+                        help='rows for the pandas path (0 to skip)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    runs = [('constant_memory', app.create_excel_export, args.rows)]
+    if args.legacy_rows:
+        runs.append(('pandas', app.create_excel_export_pandas, args.legacy_rows))
+
+    print(f"{'path':<16}{'rows':>10}{'seconds':>10}{'rows/sec':>12}{'MB':>8}")
+    for name, export, rows in runs:
+        seconds, size = time_export(export, rows, args.repeat)
+        print(f"{name:<16}{rows:>10}{seconds:>10.2f}{rows / seconds:>12,.0f}{size / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
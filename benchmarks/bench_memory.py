@@ -0,0 +1,32 @@
+"""Bytes per row of the lost-deals table before and after compaction.
+
+    python -m benchmarks.bench_memory --states 36 --rows 20000
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_lost_deals
+from data_loader import compact_frame, format_memory_report, memory_report
+from data_store import StateIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--states', type=int, default=36)
+    parser.add_argument('--rows', type=int, default=20000, help='rows per state')
+    args = parser.parse_args()
+
+    frame = make_lost_deals(states=args.states, rows_per_state=args.rows)
+    compact = compact_frame(frame)
+    print(format_memory_report(memory_report(frame, compact)))
+    for col in frame.columns:
+        print(f"  {col:<12}{str(frame[col].dtype):>10} -> {str(compact[col].dtype):<10}")
+
+    for name, table in (('plain', frame), ('compact', compact)):
+        start = time.perf_counter()
+        StateIndex(table)
+        print(f"index build ({name}): {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Cold-start time: interpreter start to the first served page.
+
+    python -m benchmarks.bench_startup --repeat 5
+
+Each run is a fresh interpreter that imports app and requests the page,
+the layout and the callback graph through the Flask test client, the way
+a new gunicorn worker serves its first visitor.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r'''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.server.test_client()
+timings = {'import': imported - start}
+for name, path in (('index', '/'), ('layout', '/_dash-layout'), ('dependencies', '/_dash-dependencies')):
+    response = client.get(path)
+    assert response.status_code == 200, (path, response.status_code)
+    timings[name] = time.perf_counter() - start
+print(json.dumps(timings))
+'''
+
+STAGES = ['import', 'index', 'layout', 'dependencies']
+
+
+def run_once():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=root, check=True,
+                            capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.repeat)]
+    print(f"{'stage (cumulative)':<22}{'median s':>10}{'min s':>10}")
+    for stage in STAGES:
+        values = [run[stage] for run in runs]
+        print(f"{stage:<22}{statistics.median(values):>10.3f}{min(values):>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
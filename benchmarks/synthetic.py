@@ -0,0 +1,45 @@
+"""Synthetic lost-deals tables for benchmarks."""
+import numpy as np
+import pandas as pd
+
+from data_store import PRIORITIES
+
+
+def make_lost_deals(states=5, rows_per_state=1000, seed=0):
+    """Lost-deals frame with ``states`` states of ``rows_per_state`` distinct reasons each"""
+    rng = np.random.default_rng(seed)
+    n = states * rows_per_state
+    state_names = [f"S{i:02d}" for i in range(states)]
+    counts = rng.integers(0, 50, size=(n, len(PRIORITIES)))
+    frame = pd.DataFrame({
+        'State': np.repeat(state_names, rows_per_state),
+        'Lost Reason': [f"Reason {i:06d}" for i in range(rows_per_state)] * states,
+        'Total Lost': counts.sum(axis=1)
+    })
+    for col, priority in enumerate(PRIORITIES):
+        frame[priority] = counts[:, col]
+    avg_mt = dict(zip(state_names, np.round(rng.uniform(5, 35, size=states), 1).tolist()))
+    frame['Avg_MT'] = frame['State'].map(avg_mt)
+    return frame
+
+
+def make_slider_trace(states, problems=3, drags=50, seed=0):
+    """Slider-drag trace: the full problem-major slider vector after every 5% step of ``drags`` drags.
+
+    Each drag moves one slider of a random state from its current value to
+    a random target, one step at a time, the way a dragged slider fires
+    callbacks. Events are ``{'state': ..., 'sliders': [...]}``.
+    """
+    rng = np.random.default_rng(seed)
+    current = {}
+    events = []
+    for _ in range(drags):
+        state = states[rng.integers(len(states))]
+        values = current.setdefault(state, [50] * (problems * len(PRIORITIES)))
+        slider = int(rng.integers(len(values)))
+        target = int(rng.integers(0, 21)) * 5
+        step = 5 if target > values[slider] else -5
+        for value in range(values[slider] + step, target + step, step):
+            values[slider] = value
+            events.append({'state': state, 'sliders': list(values)})
+    return events
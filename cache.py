@@ -0,0 +1,118 @@
+"""File-system LRU cache shared by all worker processes on a host.
+
+Each entry is one file named by the hash of its key; recency is the file
+mtime (bumped on every hit) and writes go through a temp file and
+``os.replace`` so readers never see a partial entry. With ``ttl``, entries
+not read or written for that many seconds expire. Hit/miss/eviction
+counters are kept per process.
+"""
+import hashlib
+import os
+import threading
+import time
+
+
+class FileCache:
+    """Bounded LRU of text values on disk, keyed by strings"""
+
+    def __init__(self, directory, max_entries=256, ttl=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        """Cached value for ``key`` or None"""
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as fh:
+                if self.ttl and time.time() - os.fstat(fh.fileno()).st_mtime > self.ttl:
+                    value = None
+                else:
+                    value = fh.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        if value is None:
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+                self.expirations += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(value)
+        os.replace(tmp, path)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % max(self.max_entries // 8, 1) == 0
+        if prune:
+            self.prune()
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.directory) if not entry.name.endswith('.tmp')]
+
+    def prune(self):
+        """Evict least recently used entries beyond ``max_entries``"""
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        if len(entries) <= self.max_entries:
+            return 0
+        entries.sort(reverse=True)
+        evicted = 0
+        for _, path in entries[self.max_entries:]:
+            evicted += self._remove(path)
+        with self._lock:
+            self.evictions += evicted
+        return evicted
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def clear(self):
+        for entry in self._entries():
+            self._remove(entry.path)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            evictions, expirations = self.evictions, self.expirations
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+            'evictions': evictions,
+            'expirations': expirations,
+            'entries': len(self._entries()),
+            'max_entries': self.max_entries
+        }
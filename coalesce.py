@@ -0,0 +1,77 @@
+"""Discarding superseded slider requests.
+
+Coalesced slider payloads (assets/recovery.js ``coalesce_sliders``) carry
+the page's session id and a sequence number that grows with every slider
+change in that page. The newest sequence number per session is kept in a
+SQLite file, so every worker on the host sees it. A request whose number
+is below it has been superseded: the browser drops its response anyway,
+so the server skips the work.
+
+Registering is one conditional upsert, so two workers registering
+requests of the same session at once cannot move the number backwards.
+"""
+import threading
+import time
+
+from sqlite_db import connect, create
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    session TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sequences_used ON sequences (used);
+"""
+
+REGISTER = """
+INSERT INTO sequences VALUES (?, ?, ?)
+ON CONFLICT (session) DO UPDATE SET seq = excluded.seq, used = excluded.used
+WHERE excluded.seq >= sequences.seq
+"""
+
+
+class RequestSequencer:
+    """Newest sequence number per session, shared through a SQLite file.
+
+    Sessions not seen for ``ttl`` seconds are pruned now and then.
+    """
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.discarded = 0
+        self._registered = 0
+        self._lock = threading.Lock()
+        create(path, SCHEMA)
+
+    def _discard(self):
+        with self._lock:
+            self.discarded += 1
+        return False
+
+    def register(self, session, seq):
+        """Record ``seq`` as the session's newest; False when a newer request is already known"""
+        with connect(self.path) as conn:
+            updated = conn.execute(REGISTER, (session, seq, time.time())).rowcount
+        if not updated:
+            return self._discard()
+        with self._lock:
+            self._registered += 1
+            prune = self.ttl and self._registered % 1024 == 0
+        if prune:
+            self.prune()
+        return True
+
+    def is_current(self, session, seq):
+        """False once a newer request of the session has been registered"""
+        with connect(self.path) as conn:
+            row = conn.execute('SELECT seq FROM sequences WHERE session = ?', (session,)).fetchone()
+        if row is not None and row[0] > seq:
+            return self._discard()
+        return True
+
+    def prune(self):
+        """Forget sessions not seen for ``ttl`` seconds"""
+        with connect(self.path) as conn:
+            return conn.execute('DELETE FROM sequences WHERE used < ?', (time.time() - self.ttl,)).rowcount
@@ -0,0 +1,122 @@
+"""State -> district -> rep pre-aggregation of detail-level lost-deals rows.
+
+Sources with District (and Rep) columns have one row per (state,
+district, rep, lost reason). The cube rolls them up once per state into
+lost-reason rows for every node of the hierarchy: one groupby per level,
+sorted so each node is a contiguous slice. Looking up a drill level is
+then a slice of a prebuilt frame, not a groupby over the detail rows.
+
+Node rows have the same columns as the state-level table (State, Lost
+Reason, counts, Avg_MT) plus the level columns, so ``StateIndex`` indexes
+a node exactly like a state. A node's Avg_MT is the Total Lost-weighted
+mean of its detail rows.
+
+Nodes are keyed by their path joined with ``NODE_SEPARATOR``, e.g.
+``'KA › North › Ravi'``; a state's key is the state itself.
+"""
+import pandas as pd
+
+HIERARCHY_COLUMNS = ['District', 'Rep']
+COUNT_COLUMNS = ['Total Lost', 'P1', 'P2', 'P3', 'P4']
+NODE_SEPARATOR = ' › '
+
+
+def hierarchy_levels(frame):
+    """Drill levels below State present in ``frame``, outermost first"""
+    levels = []
+    for column in HIERARCHY_COLUMNS:
+        if column not in frame.columns:
+            break
+        levels.append(column)
+    return levels
+
+
+def node_key(path):
+    return NODE_SEPARATOR.join(str(part) for part in path)
+
+
+def node_path(key):
+    return tuple(key.split(NODE_SEPARATOR))
+
+
+def rollup(rows, levels):
+    """Lost-reason rows summed per node of ``['State'] + levels``, sorted by node"""
+    keys = ['State'] + levels
+    avg_mt = rows['Avg_MT'].astype('float64')
+    weighted = rows.assign(_weighted=avg_mt * rows['Total Lost'].astype('float64'), _avg=avg_mt, _rows=1)
+    reasons = weighted.groupby(keys + ['Lost Reason'], observed=True, sort=True)[
+        COUNT_COLUMNS + ['_weighted', '_avg', '_rows']].sum().reset_index()
+    # Node totals, from the (much smaller) reason rows
+    node = reasons.groupby(keys, observed=True, sort=False)[['Total Lost', '_weighted', '_avg', '_rows']].transform('sum')
+    # Total Lost-weighted; nodes without lost customers fall back to the plain mean
+    weighted_mean = node['_weighted'] / node['Total Lost'].where(node['Total Lost'] > 0)
+    reasons['Avg_MT'] = weighted_mean.fillna(node['_avg'] / node['_rows']).round(4)
+    for column in COUNT_COLUMNS:
+        reasons[column] = reasons[column].astype('int64')
+    for column in keys + ['Lost Reason']:
+        reasons[column] = reasons[column].astype(str)
+    return reasons[['State', 'Lost Reason'] + COUNT_COLUMNS + ['Avg_MT'] + levels]
+
+
+class DrillCube:
+    """Per-state rollups of every hierarchy level, with each node's slice"""
+
+    def __init__(self, frame, levels=None):
+        self.levels = levels if levels is not None else hierarchy_levels(frame)
+        self.rollups = {}
+        self.spans = {}
+        self.children = {}
+        for state, rows in frame.groupby('State', observed=True, sort=False):
+            self._add_state(str(state), rows)
+
+    def updated(self, frame, changed_states):
+        """New cube re-aggregating only ``changed_states``; other states are shared"""
+        cube = DrillCube(frame.iloc[:0], self.levels)
+        changed = {str(state) for state in changed_states}
+        present = {str(state) for state in pd.unique(frame['State'])}
+        for state in present - changed:
+            if state in self.rollups:
+                cube.rollups[state] = self.rollups[state]
+                cube.children[state] = self.children[state]
+        for key, span in self.spans.items():
+            if span[0] in cube.rollups:
+                cube.spans[key] = span
+                if key in self.children:
+                    cube.children[key] = self.children[key]
+        rows = frame[frame['State'].astype(str).isin(changed & present)]
+        for state, part in rows.groupby('State', observed=True, sort=False):
+            cube._add_state(str(state), part)
+        return cube
+
+    def _add_state(self, state, rows):
+        self.rollups[state] = {}
+        self.children[state] = []
+        for depth in range(len(self.levels) + 1):
+            levels = self.levels[:depth]
+            rolled = rollup(rows, levels)
+            self.rollups[state][depth] = rolled
+            if depth == 0:
+                continue
+            for path, positions in rolled.groupby(['State'] + levels, sort=True).indices.items():
+                key = node_key(path)
+                self.spans[key] = (state, depth, positions[0], positions[-1] + 1)
+                self.children.setdefault(node_key(path[:-1]), []).append(key)
+                self.children.setdefault(key, [])
+
+    def state_rows(self, states=None):
+        """State-level lost-reason rows (no level columns) of ``states``, default all"""
+        states = self.rollups if states is None else [str(state) for state in states if str(state) in self.rollups]
+        parts = [self.rollups[state][0] for state in states]
+        if not parts:
+            return pd.DataFrame(columns=['State', 'Lost Reason'] + COUNT_COLUMNS + ['Avg_MT'])
+        return pd.concat(parts, ignore_index=True)
+
+    def __contains__(self, key):
+        return key in self.spans
+
+    def partition(self, key):
+        state, depth, start, stop = self.spans[key]
+        return self.rollups[state][depth].iloc[start:stop]
+
+    def child_keys(self, key):
+        return self.children.get(key, [])
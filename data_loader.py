@@ -0,0 +1,410 @@
+"""Lost-customer data sources with change detection and incremental reload.
+
+A source reads the lost-deals table from CSV, Parquet or SQLite and, on
+``poll()``, returns only what changed since the last read:
+
+* CSV      - appended lines are parsed from the last byte offset; any other
+             edit (detected by size/mtime and a tail checksum) triggers a
+             full re-read.
+* Parquet  - mtime/size change triggers a full re-read.
+* SQLite   - rows above the last watermark (``rowid`` by default, or an
+             ``updated_at``-style column) are fetched; a shrinking table
+             triggers a full re-read.
+
+``apply_changes`` upserts the rows into the current frame keyed by
+(State, Lost Reason), or (State, District, Rep, Lost Reason) for
+detail-level sources, and reports which states changed, so the
+``DataStore`` only re-indexes those. ``DataReloader`` runs this in a
+daemon thread; callbacks keep reading the previous snapshot until the new
+index is swapped in.
+"""
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from cube import hierarchy_levels
+from months import current_month
+from sqlite_db import connect
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ['State', 'Lost Reason']
+VALUE_COLUMNS = ['Total Lost', 'P1', 'P2', 'P3', 'P4']
+REQUIRED_COLUMNS = KEY_COLUMNS + VALUE_COLUMNS
+
+_TAIL_BYTES = 256
+
+
+def key_columns(frame):
+    """Row key: State, the District/Rep levels the frame has, Lost Reason"""
+    return ['State'] + hierarchy_levels(frame) + ['Lost Reason']
+
+
+class DataSource:
+    """Base class for lost-deals sources.
+
+    ``load()`` returns the full table and resets the change watermark.
+    ``poll()`` returns ``None`` when nothing changed, otherwise a
+    ``(rows, full)`` tuple where ``full`` says whether ``rows`` replaces the
+    table or only holds new/changed rows. The first ``poll()`` of a source
+    that was never loaded returns the full table.
+    """
+
+    def load(self):
+        raise NotImplementedError
+
+    def poll(self):
+        raise NotImplementedError
+
+
+class _FileSource(DataSource):
+    def __init__(self, path):
+        self.path = path
+        self._stat = None
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _changed(self):
+        return self._signature() != self._stat
+
+
+class CSVSource(_FileSource):
+    """CSV file; appended rows are read incrementally from the last offset"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._columns = None
+        self._offset = 0
+        self._tail = b''
+
+    def _remember_tail(self, fh):
+        self._offset = fh.tell()
+        fh.seek(max(self._offset - _TAIL_BYTES, 0))
+        self._tail = fh.read(self._offset - fh.tell())
+
+    def load(self):
+        self._stat = self._signature()
+        with open(self.path, 'rb') as fh:
+            frame = pd.read_csv(fh)
+            self._remember_tail(fh)
+        self._columns = list(frame.columns)
+        return frame
+
+    def _appended_only(self):
+        if self._columns is None or self._stat[1] > os.path.getsize(self.path):
+            return False
+        with open(self.path, 'rb') as fh:
+            fh.seek(max(self._offset - _TAIL_BYTES, 0))
+            return fh.read(len(self._tail)) == self._tail
+
+    def poll(self):
+        if not self._changed():
+            return None
+        if not self._appended_only():
+            return self.load(), True
+        self._stat = self._signature()
+        with open(self.path, 'rb') as fh:
+            fh.seek(self._offset)
+            try:
+                rows = pd.read_csv(fh, header=None, names=self._columns)
+            except pd.errors.EmptyDataError:
+                rows = pd.DataFrame(columns=self._columns)
+            self._remember_tail(fh)
+        return rows, False
+
+
+class ParquetSource(_FileSource):
+    """Parquet file; re-read in full when its mtime or size changes"""
+
+    def load(self):
+        self._stat = self._signature()
+        return pd.read_parquet(self.path)
+
+    def poll(self):
+        if not self._changed():
+            return None
+        return self.load(), True
+
+
+class SQLiteSource(DataSource):
+    """SQLite table read incrementally above a row watermark.
+
+    With the default ``rowid`` watermark only inserts are picked up
+    incrementally; point ``watermark`` at a monotonically increasing
+    ``updated_at``/version column to also catch in-place updates.
+    """
+
+    def __init__(self, path, table='lost_deals', watermark='rowid'):
+        self.path = path
+        self.table = table
+        self.watermark = watermark
+        self._files = None
+        self._count = 0
+        self._high = None
+
+    def _file_signature(self):
+        signature = []
+        for suffix in ('', '-wal'):
+            try:
+                stat = os.stat(self.path + suffix)
+            except FileNotFoundError:
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return signature
+
+    def _select(self, conn, where='', params=()):
+        sql = f'SELECT {self.watermark} AS _watermark, * FROM "{self.table}" {where}'
+        return pd.read_sql_query(sql, conn, params=params).drop(columns='_watermark')
+
+    def _stats(self, conn):
+        return conn.execute(f'SELECT COUNT(*), MAX({self.watermark}) FROM "{self.table}"').fetchone()
+
+    def load(self):
+        self._files = self._file_signature()
+        with connect(self.path, read_only=True) as conn:
+            self._count, self._high = self._stats(conn)
+            return self._select(conn)
+
+    def poll(self):
+        # Never loaded in this process: there is no watermark to read above
+        if self._files is None:
+            return self.load(), True
+        files = self._file_signature()
+        if files == self._files:
+            return None
+        self._files = files
+        with connect(self.path, read_only=True) as conn:
+            count, high = self._stats(conn)
+            if count < self._count or self._high is None:
+                self._count, self._high = count, high
+                return self._select(conn), True
+            if high == self._high:
+                return None
+            rows = self._select(conn, f'WHERE {self.watermark} > ?', (self._high,))
+            self._count, self._high = count, high
+            return rows, False
+
+
+def open_source(path, table='lost_deals', watermark='rowid'):
+    """Pick a DataSource implementation from the file extension"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return CSVSource(path)
+    if ext in ('.parquet', '.pq'):
+        return ParquetSource(path)
+    if ext in ('.db', '.sqlite', '.sqlite3'):
+        return SQLiteSource(path, table=table, watermark=watermark)
+    raise ValueError(f"Unsupported data source: {path}")
+
+
+def normalize_frame(frame, avg_mt=None):
+    """Validate columns, drop duplicate keys and attach ``Avg_MT``.
+
+    ``Avg_MT`` comes from the source when it has the column, otherwise from
+    the ``avg_mt`` state map; states with neither are dropped.
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Data source is missing columns: {missing}")
+    has_avg = 'Avg_MT' in frame.columns
+    levels = hierarchy_levels(frame)
+    frame = frame[REQUIRED_COLUMNS + (['Avg_MT'] if has_avg else []) + levels]
+    if levels:
+        frame = frame.assign(**{level: frame[level].fillna('Unassigned').astype(str) for level in levels})
+    frame = frame.drop_duplicates(key_columns(frame), keep='last').reset_index(drop=True)
+    if avg_mt is not None:
+        mapped = frame['State'].map(avg_mt)
+        frame['Avg_MT'] = frame['Avg_MT'].fillna(mapped) if has_avg else mapped
+    elif not has_avg:
+        raise ValueError("Data source has no Avg_MT column and no avg_mt map was given")
+    unknown = frame['Avg_MT'].isna()
+    if unknown.any():
+        logger.warning("Dropping states without Avg_MT: %s", sorted(frame.loc[unknown, 'State'].unique()))
+        frame = frame[~unknown].reset_index(drop=True)
+    frame[VALUE_COLUMNS] = frame[VALUE_COLUMNS].astype('int64')
+    return frame
+
+
+def compact_frame(frame):
+    """Compact in-memory schema for the lost-deals table.
+
+    The key columns (State, District/Rep, Lost Reason) become categoricals,
+    the counts the smallest integer dtype that fits and Avg_MT float32.
+    Every worker holds its own copy of the table, so this is what bounds
+    per-worker memory.
+    """
+    compact = {col: frame[col].astype('category') for col in key_columns(frame)}
+    for col in VALUE_COLUMNS:
+        values = frame[col]
+        downcast = 'unsigned' if len(values) == 0 or values.min() >= 0 else 'integer'
+        compact[col] = pd.to_numeric(values, downcast=downcast)
+    compact['Avg_MT'] = frame['Avg_MT'].astype('float32')
+    extra = [col for col in frame.columns if col not in compact]
+    return pd.DataFrame({col: compact.get(col, frame[col]) for col in list(compact) + extra})
+
+
+def expand_frame(frame):
+    """Plain dtypes for presentation (exports): object strings, int64 and float64.
+
+    float32 Avg_MT values go through their shortest repr so 14.8 stays 14.8
+    rather than becoming 14.800000190734863.
+    """
+    expanded = frame.copy()
+    for col in frame.columns:
+        dtype = frame[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            expanded[col] = frame[col].astype(object)
+        elif pd.api.types.is_integer_dtype(dtype):
+            expanded[col] = frame[col].astype('int64')
+        elif dtype == 'float32':
+            expanded[col] = frame[col].astype(str).astype('float64')
+    return expanded
+
+
+def memory_report(before, after):
+    """Deep memory use of two versions of the table, in total and per row"""
+    rows = max(len(before), 1)
+    before_bytes = int(before.memory_usage(index=True, deep=True).sum())
+    after_bytes = int(after.memory_usage(index=True, deep=True).sum())
+    return {
+        'rows': len(before),
+        'before_bytes': before_bytes,
+        'after_bytes': after_bytes,
+        'before_bytes_per_row': before_bytes / rows,
+        'after_bytes_per_row': after_bytes / rows,
+        'reduction': 1 - after_bytes / before_bytes if before_bytes else 0.0
+    }
+
+
+def format_memory_report(report):
+    return (f"{report['rows']:,} rows: {report['before_bytes_per_row']:.1f} -> "
+            f"{report['after_bytes_per_row']:.1f} bytes/row "
+            f"({report['before_bytes'] / 1e6:.2f} -> {report['after_bytes'] / 1e6:.2f} MB, "
+            f"{report['reduction']:.0%} smaller)")
+
+
+def _rows_differ(old, new):
+    """Row-wise comparison of value columns; Avg_MT at the float32 precision it is stored with"""
+    differs = (old[VALUE_COLUMNS].to_numpy('int64') != new[VALUE_COLUMNS].to_numpy('int64')).any(axis=1)
+    return differs | (old['Avg_MT'].to_numpy('float32') != new['Avg_MT'].to_numpy('float32'))
+
+
+def _changed_states(old, new):
+    """States whose rows differ between two frames"""
+    keys = key_columns(new)
+    if key_columns(old) != keys:
+        # Hierarchy columns came or went: every state is re-indexed
+        return set(old['State']) | set(new['State'])
+    old_keys = pd.MultiIndex.from_frame(old[keys].astype(object))
+    new_keys = pd.MultiIndex.from_frame(new[keys].astype(object))
+    positions = old_keys.get_indexer(new_keys)
+    existing = positions >= 0
+    changed = set(new['State'][~existing])
+    changed |= set(old['State'][~old_keys.isin(new_keys)])
+    differs = _rows_differ(old.iloc[positions[existing]], new[existing])
+    changed |= set(new['State'][existing][differs])
+    return changed
+
+
+def apply_changes(frame, rows, full=False, avg_mt=None):
+    """Merge source rows into ``frame``; returns ``(new_frame, changed_states)``.
+
+    ``full`` replaces the table (the diff still limits the re-index to the
+    states that actually changed). Otherwise ``rows`` are upserted: existing
+    keys are updated in place and new keys appended. The result uses plain
+    dtypes; compact it again if needed.
+    """
+    rows = normalize_frame(rows, avg_mt)
+    if full:
+        return rows, _changed_states(frame, rows)
+    if rows.empty:
+        return frame, set()
+    columns = VALUE_COLUMNS + ['Avg_MT']
+    keys = key_columns(rows)
+    positions = pd.MultiIndex.from_frame(frame[keys].astype(object)).get_indexer(
+        pd.MultiIndex.from_frame(rows[keys]))
+    existing = positions >= 0
+    modified = _rows_differ(frame.iloc[positions[existing]], rows[existing])
+    changed = set(rows['State'][existing][modified]) | set(rows['State'][~existing])
+    if not changed:
+        return frame, changed
+    updated = expand_frame(frame)
+    for col in columns:
+        updated.iloc[positions[existing], updated.columns.get_loc(col)] = rows.loc[existing, col].to_numpy()
+    merged = pd.concat([updated, rows[~existing]], ignore_index=True)
+    return merged, changed
+
+
+class DataReloader:
+    """Polls a DataSource in a daemon thread and publishes changes to a DataStore.
+
+    Changes are applied to the last table the reloader read, District/Rep
+    rows included, rather than to the store's frame: a store attached to
+    published shared data only holds state-level rows.
+
+    With a ``history`` (history.HistoryStore), changed states are also
+    recorded as the current month's snapshot; the first reload of a month
+    records every state.
+    """
+
+    def __init__(self, source, store, interval=30.0, avg_mt=None, compact=True, history=None):
+        self.source = source
+        self.store = store
+        self.interval = interval
+        self.avg_mt = avg_mt
+        self.compact = compact
+        self.history = history
+        self._history_month = None
+        # Source table as last read; the store's frame until the first reload
+        self._frame = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reload_once(self):
+        """Apply pending source changes; returns the set of changed states"""
+        result = self.source.poll()
+        changed = set()
+        if result is not None:
+            rows, full = result
+            previous = self.store.current.frame if self._frame is None else self._frame
+            frame, changed = apply_changes(previous, rows, full=full, avg_mt=self.avg_mt)
+            if changed:
+                if self.compact:
+                    frame = compact_frame(frame)
+                self._frame = frame
+                self.store.rebuild(frame, changed)
+                logger.info("Reloaded lost-deals data for %s", sorted(changed))
+        if self.history is not None:
+            self._record_history(changed)
+        return changed
+
+    def _record_history(self, changed):
+        month = current_month()
+        if month == self._history_month and not changed:
+            return
+        index = self.store.current
+        # A new month starts with a full snapshot
+        states = changed if month == self._history_month else None
+        self.history.record_snapshot(index.frame, month, states=states, version=index.version)
+        self._history_month = month
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload_once()
+            except Exception:
+                logger.exception("Lost-deals reload failed; keeping previous data")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='data-reloader', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
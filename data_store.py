@@ -0,0 +1,236 @@
+"""State-indexed view of the lost-deals table.
+
+The dashboard callbacks look states up in a prebuilt index instead of
+filtering the whole frame with a boolean mask on every request.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cube import DrillCube, hierarchy_levels
+
+PRIORITIES = ['P1', 'P2', 'P3', 'P4']
+TOP_PROBLEMS = 3
+
+
+def frame_version(frame):
+    """Content fingerprint of a frame, identical in every process that loads the same data"""
+    if frame.empty:
+        return '0'
+    hashed = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    return f"{int(hashed.sum(dtype='uint64')):016x}-{len(frame)}"
+
+
+def top_positions(values, n):
+    """Positions of the ``n`` largest ``values``, largest first.
+
+    Same rows and order as ``nlargest(n, keep='first')``: ties rank by
+    position. Selection is an O(len) argpartition; only the ``n`` selected
+    rows are sorted.
+    """
+    values = np.asarray(values)
+    if n <= 0 or len(values) == 0:
+        return np.empty(0, dtype=np.intp)
+    if n < len(values):
+        threshold = values[np.argpartition(values, len(values) - n)[len(values) - n]]
+        above = np.flatnonzero(values > threshold)
+        ties = np.flatnonzero(values == threshold)[:n - len(above)]
+        positions = np.sort(np.concatenate([above, ties]))
+    else:
+        positions = np.arange(len(values))
+    # Stable descending sort: ascending over the reversed rows, then reversed
+    order = np.argsort(values[positions][::-1], kind='stable')[::-1]
+    return positions[::-1][order]
+
+
+class _NodeEntries(dict):
+    """Per-state index entries; a drill-down node's are computed on first lookup"""
+
+    def __init__(self, index):
+        super().__init__()
+        self._index = index
+
+    def __missing__(self, key):
+        self._index._index_node(key)
+        return dict.__getitem__(self, key)
+
+
+class StateIndex:
+    """Immutable per-state partition of the lost-deals table.
+
+    Everything the callbacks need per state (rows, top problems, summary,
+    priority totals) is computed once when the index is built.
+
+    A table with District/Rep columns holds detail rows; the index then
+    keeps a DrillCube of it and its states are the cube's state-level
+    rollups. Drill-down nodes (cube keys such as 'KA › North') can be used
+    wherever a state is, and are indexed from the cube on first use.
+    """
+
+    def __init__(self, frame, version=None, top_n=TOP_PROBLEMS):
+        self.frame = frame
+        self.version = version or frame_version(frame)
+        self.top_n = top_n
+        self.partitions = _NodeEntries(self)
+        self.top = _NodeEntries(self)
+        self.top_customers = _NodeEntries(self)
+        self.summaries = _NodeEntries(self)
+        self.priority_totals = _NodeEntries(self)
+        # Lost Reason x State rollup of Total Lost; built on first use
+        self._lost_pivot = None
+        levels = hierarchy_levels(frame)
+        self.cube = DrillCube(frame, levels) if levels else None
+        rows = self.cube.state_rows() if self.cube is not None else frame
+        for state, part in rows.groupby('State', sort=False, observed=True):
+            self._index_state(state, part)
+        self.states = list(self.partitions)
+
+    def updated(self, frame, changed_states, version=None):
+        """New index for ``frame`` that re-indexes only ``changed_states``.
+
+        Entries for every other state are shared with this index, so a reload
+        touching one state costs a groupby over that state's rows only.
+        """
+        index = StateIndex(frame.iloc[:0], version=version or frame_version(frame), top_n=self.top_n)
+        index.frame = frame
+        changed = set(changed_states)
+        levels = hierarchy_levels(frame)
+        if self.cube is not None and levels == self.cube.levels:
+            index.cube = self.cube.updated(frame, changed)
+        else:
+            index.cube = DrillCube(frame, levels) if levels else None
+        states = list(pd.unique(frame['State']))
+        for state in states:
+            if state not in changed and state in self.partitions:
+                index.partitions[state] = self.partitions[state]
+                index.top[state] = self.top[state]
+                index.top_customers[state] = self.top_customers[state]
+                index.summaries[state] = self.summaries[state]
+                index.priority_totals[state] = self.priority_totals[state]
+        if index.cube is not None:
+            rows = index.cube.state_rows(changed)
+        else:
+            rows = frame[frame['State'].isin(changed)]
+        for state, part in rows.groupby('State', sort=False, observed=True):
+            index._index_state(state, part)
+        index.states = [state for state in states if state in index.partitions]
+        if self._lost_pivot is not None:
+            # Carry the rollup over: only changed, added and removed states' columns move
+            pivot = self._lost_pivot.drop(columns=[
+                state for state in self._lost_pivot.columns if state in changed or state not in index.partitions])
+            fresh = [state for state in index.states if state not in pivot.columns]
+            if fresh:
+                pivot = pd.concat([pivot, index._pivot_states(fresh)], axis=1)
+            index._lost_pivot = pivot.dropna(how='all').reindex(columns=index.states)
+        return index
+
+    @classmethod
+    def from_parts(cls, frame, version, top_n, parts):
+        """Index assembled from precomputed per-state entries, without a groupby.
+
+        ``parts`` yields ``(state, partition, top_positions, summary,
+        priority_totals)`` with top rows given as positions in the partition.
+        """
+        index = cls(frame.iloc[:0], version=version, top_n=top_n)
+        index.frame = frame
+        for state, part, top_positions, summary, priority_totals in parts:
+            index.partitions[state] = part
+            index.top[state] = part.iloc[top_positions]
+            index.top_customers[state] = index.top[state][PRIORITIES].to_numpy()
+            index.summaries[state] = summary
+            index.priority_totals[state] = priority_totals
+        index.states = list(index.partitions)
+        return index
+
+    def _index_node(self, key):
+        if self.cube is None or key not in self.cube:
+            raise KeyError(key)
+        self._index_state(key, self.cube.partition(key))
+
+    def _index_state(self, state, part):
+        self.partitions[state] = part
+        self.top[state] = part.iloc[top_positions(part['Total Lost'].to_numpy(), self.top_n)]
+        self.top_customers[state] = self.top[state][PRIORITIES].to_numpy()
+        self.priority_totals[state] = [part[p].sum().item() for p in PRIORITIES]
+        self.summaries[state] = {
+            'total_lost': part['Total Lost'].sum().item(),
+            # via str: a float32 Avg_MT of 14.8 should read 14.8, not 14.800000190734863
+            'avg_mt': float(str(part['Avg_MT'].iloc[0])),
+            'problems_count': len(part),
+            'highest_loss': part['Total Lost'].max().item(),
+            'highest_loss_reason': part.loc[part['Total Lost'].idxmax(), 'Lost Reason']
+        }
+
+    def _pivot_states(self, states):
+        columns = {
+            state: pd.Series(self.partitions[state]['Total Lost'].to_numpy('int64'),
+                             index=self.partitions[state]['Lost Reason'].astype(str).to_numpy())
+            for state in states
+        }
+        if not columns:
+            return pd.DataFrame(dtype='float64')
+        return pd.concat(columns, axis=1).astype('float64')
+
+    @property
+    def lost_pivot(self):
+        """Total Lost by Lost Reason (rows) and state (columns); NaN where a state lacks the reason"""
+        if self._lost_pivot is None:
+            self._lost_pivot = self._pivot_states(self.states)
+        return self._lost_pivot
+
+    def __contains__(self, state):
+        return state in self.partitions or (self.cube is not None and state in self.cube)
+
+    def partition(self, state):
+        return self.partitions[state]
+
+    def top_problems(self, state):
+        return self.top[state]
+
+    def summary(self, state):
+        return self.summaries[state]
+
+    def avg_mt(self, state):
+        return self.summaries[state]['avg_mt']
+
+
+class DataStore:
+    """Holds the current StateIndex and swaps it atomically when data changes.
+
+    Readers take ``store.current`` once per request and keep using that
+    snapshot, so a rebuild never shows them a half-updated index.
+    """
+
+    def __init__(self, frame=None, index=None, top_n=TOP_PROBLEMS):
+        self._lock = threading.Lock()
+        self._index = index if index is not None else StateIndex(frame, top_n=top_n)
+
+    @property
+    def current(self):
+        return self._index
+
+    @property
+    def version(self):
+        return self._index.version
+
+    def rebuild(self, frame, changed_states=None):
+        """Build a new index for ``frame`` and publish it in one assignment.
+
+        With ``changed_states`` only those states are re-indexed; the rest are
+        carried over from the current index.
+        """
+        with self._lock:
+            current = self._index
+            if changed_states is None:
+                index = StateIndex(frame, top_n=current.top_n)
+            else:
+                index = current.updated(frame, changed_states)
+            self._index = index
+        return index
+
+    def swap(self, index):
+        """Publish an index built elsewhere (e.g. attached from shared memory)"""
+        with self._lock:
+            self._index = index
+        return index
@@ -0,0 +1,48 @@
+"""Initial load of the lost-deals table.
+
+Kept apart from app.py so the gunicorn master (gunicorn.conf.py) can load
+and publish the table without importing the Dash app.
+"""
+import logging
+
+import pandas as pd
+
+from data_loader import compact_frame, format_memory_report, memory_report, normalize_frame
+
+logger = logging.getLogger(__name__)
+
+# Built-in sample, used when no external data source is configured
+SAMPLE_DATA = {
+    'State': ['APTS', 'APTS', 'APTS', 'KA', 'KA', 'KA', 'MH', 'MH', 'MH', 'TN', 'TN', 'TN', 'WB', 'WB', 'WB'],
+    'Lost Reason': [
+        'Bidding/ Requirement cancelled/ Uncertain/ Delay',
+        'P- Same brand', 'Price discovery', 'P- Same brand', 'P- Other brand', 'Credit',
+        'Credit', 'P- Same brand', 'Bidding/ Requirement cancelled/ Uncertain/ Delay',
+        'Price discovery', 'Others', 'Bidding/ Requirement cancelled/ Uncertain/ Delay',
+        'Price discovery', 'Bidding/ Requirement cancelled/ Uncertain/ Delay', 'Others'
+    ],
+    'Total Lost': [54, 37, 33, 66, 11, 7, 113, 46, 45, 53, 20, 17, 20, 11, 9],
+    'P1': [6, 1, 1, 11, 1, 0, 0, 1, 3, 9, 5, 5, 2, 1, 0],
+    'P2': [4, 4, 3, 9, 4, 0, 3, 1, 5, 7, 4, 1, 3, 2, 2],
+    'P3': [8, 3, 3, 8, 0, 1, 0, 2, 5, 3, 3, 0, 0, 1, 2],
+    'P4': [36, 29, 26, 38, 6, 6, 110, 42, 32, 34, 8, 11, 15, 7, 5]
+}
+
+# Fallback avg MT per state for sources without an Avg_MT column
+AVG_MT = {'APTS': 14.8, 'WB': 31.5, 'MH': 10.1, 'TN': 21.5, 'KA': 15.2}
+
+
+def load_lost_deals(source=None, compact=True):
+    """Lost-deals table from ``source`` (a DataSource) or the built-in sample"""
+    if source is not None:
+        frame = normalize_frame(source.load(), AVG_MT)
+    else:
+        frame = pd.DataFrame(SAMPLE_DATA)
+        frame['Avg_MT'] = frame['State'].map(AVG_MT)
+
+    # Categorical keys and narrow numeric columns
+    if compact:
+        compact_df = compact_frame(frame)
+        logger.info("Compact lost-deals table: %s", format_memory_report(memory_report(frame, compact_df)))
+        frame = compact_df
+    return frame
@@ -0,0 +1,239 @@
+"""Streaming writer for the recovery analysis workbook.
+
+Produces the same four sheets as ``create_excel_export`` in app.py, but
+writes each cell exactly once: formats are defined per column and rows go
+out in order (``write_row`` where a row shares one format), so the workbook
+can run in xlsxwriter's ``constant_memory`` mode and flush each row to disk
+as soon as it is complete.
+
+Column formats are passed with the cell writes rather than set with
+``set_column``, which would also paint borders on every empty cell below
+the table.
+
+xlsxwriter is imported on first use, not on import: it is only needed
+when an export is actually written.
+"""
+
+TITLE = {
+    'bold': True, 'font_size': 16, 'font_color': '#1a202c', 'bg_color': '#e2e8f0',
+    'border': 1, 'align': 'center', 'valign': 'vcenter'
+}
+HEADER = {
+    'bold': True, 'font_size': 12, 'font_color': 'white', 'bg_color': '#2c5aa0',
+    'border': 1, 'align': 'center', 'valign': 'vcenter'
+}
+SUBHEADER = {
+    'bold': True, 'font_size': 11, 'font_color': '#1a202c', 'bg_color': '#f8fafc',
+    'border': 1, 'align': 'left', 'valign': 'vcenter'
+}
+DATA = {'font_size': 10, 'border': 1, 'align': 'center', 'valign': 'vcenter'}
+NUMBER = dict(DATA, num_format='#,##0.0')
+PERCENTAGE = dict(DATA, num_format='0%')
+CURRENCY = dict(DATA, num_format='#,##0.0" MT"')
+
+ANALYSIS_COLUMNS = [
+    ('Problem', 35, 'data'),
+    ('Priority Level', 15, 'data'),
+    ('Lost Customers', 15, 'data'),
+    ('Conversion Rate', 15, 'percentage'),
+    ('Potential Customers', 18, 'number'),
+    ('Recovery Potential (MT)', 20, 'currency'),
+    ('Problem Total (MT)', 18, 'currency')
+]
+PROBLEM_COLUMNS = [
+    ('Problem', 35, 'data'),
+    ('Total Lost Customers', 20, 'data'),
+    ('Average Conversion Rate', 22, 'percentage'),
+    ('Recovery Potential (MT/month)', 25, 'currency'),
+    ('Percentage of Total Recovery', 28, 'percentage')
+]
+
+
+def _add_formats(workbook):
+    return {
+        'title': workbook.add_format(TITLE),
+        'header': workbook.add_format(HEADER),
+        'subheader': workbook.add_format(SUBHEADER),
+        'data': workbook.add_format(DATA),
+        'number': workbook.add_format(NUMBER),
+        'percentage': workbook.add_format(PERCENTAGE),
+        'currency': workbook.add_format(CURRENCY)
+    }
+
+
+def _table_sheet(workbook, formats, name, title, columns, rows):
+    """Title row, header row and the data rows, formatted per column"""
+    sheet = workbook.add_worksheet(name)
+    for col, (_, width, _) in enumerate(columns):
+        sheet.set_column(col, col, width)
+    sheet.merge_range(0, 0, 0, len(columns) - 1, title, formats['title'])
+    sheet.write_row(2, 0, [header for header, _, _ in columns], formats['header'])
+    _table_rows(sheet, formats, columns, rows)
+    return sheet
+
+
+def _table_rows(sheet, formats, columns, rows):
+    column_formats = [formats[fmt] for _, _, fmt in columns]
+    for row, values in enumerate(rows, start=3):
+        for col, value in enumerate(values):
+            sheet.write(row, col, value, column_formats[col])
+
+
+def _raw_sheet(workbook, formats, name, title, columns, rows, widths):
+    sheet = workbook.add_worksheet(name)
+    for col, width in enumerate(widths):
+        sheet.set_column(col, col, width)
+    sheet.merge_range(0, 0, 0, max(len(columns), 8) - 1, title, formats['title'])
+    sheet.write_row(2, 0, list(columns), formats['header'])
+    for row, values in enumerate(rows, start=3):
+        sheet.write_row(row, 0, values, formats['data'])
+    return sheet
+
+
+def analysis_rows(calculations_data):
+    """Detailed Analysis rows, one per problem and priority"""
+    return [
+        (problem['name'], priority['priority'], priority['customers'],
+         priority['conversion_rate'] / 100, priority['potential_customers'],
+         priority['potential_mt'], problem['total_mt'])
+        for problem in calculations_data.get('problems', []) for priority in problem['priorities']
+    ]
+
+
+def raw_column_widths(state_data):
+    """Column widths for the raw data sheet: longest header or value + 2, capped at 30"""
+    if state_data.empty:
+        value_widths = [0] * len(state_data.columns)
+    else:
+        value_widths = state_data.astype(str).apply(lambda col: col.str.len().max()).tolist()
+    return [min(max(len(str(header)), width) + 2, 30)
+            for header, width in zip(state_data.columns, value_widths)]
+
+
+def write_recovery_report(output, state, calculations_data, summary, state_data, generated_at):
+    """Write the recovery analysis workbook for ``state`` to ``output``.
+
+    ``summary`` is the state summary from the data index and ``state_data``
+    the state's rows for the Raw Data sheet.
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'nan_inf_to_errors': True})
+    formats = _add_formats(workbook)
+    problems = calculations_data.get('problems', [])
+    total_mt = calculations_data.get('total_mt', 0)
+
+    # 1. Executive Summary
+    sheet = workbook.add_worksheet('Executive Summary')
+    sheet.set_column('A:A', 25)
+    sheet.set_column('B:B', 30)
+    sheet.merge_range('A1:B1', f'Recovery Analysis Report - {state}', formats['title'])
+    sheet.write_row(2, 0, ['Metric', 'Value'], formats['header'])
+    summary_rows = [
+        ('State', state),
+        ('Analysis Date', generated_at),
+        ('Total Lost Customers', summary['total_lost']),
+        ('Average MT per Customer', f"{summary['avg_mt']} MT"),
+        ('Total Recovery Potential (MT/month)', f"{total_mt:.1f} MT/month"),
+        ('Number of Problems Analyzed', len(problems)),
+        ('Highest Impact Problem', summary['highest_loss_reason'])
+    ]
+    for row, (metric, value) in enumerate(summary_rows, start=3):
+        sheet.write(row, 0, metric, formats['subheader'])
+        sheet.write(row, 1, value, formats['data'])
+
+    # 2. Detailed Analysis
+    if problems:
+        _table_sheet(workbook, formats, 'Detailed Analysis', 'Detailed Recovery Potential Analysis',
+                     ANALYSIS_COLUMNS, analysis_rows(calculations_data))
+
+    # 3. Problem Summary
+    if problems:
+        def problem_row(problem):
+            priorities = problem['priorities']
+            share = problem['total_mt'] / calculations_data.get('total_mt', 1) if total_mt > 0 else 0
+            return (problem['name'],
+                    sum(p['customers'] for p in priorities),
+                    sum(p['conversion_rate'] for p in priorities) / len(priorities) / 100,
+                    problem['total_mt'],
+                    share)
+
+        _table_sheet(workbook, formats, 'Problem Summary', 'Problem-wise Recovery Summary',
+                     PROBLEM_COLUMNS, (problem_row(problem) for problem in problems))
+
+    # 4. Raw Data
+    _raw_sheet(workbook, formats, 'Raw Data', f'Raw Data for {state}', state_data.columns,
+               state_data.itertuples(index=False, name=None), raw_column_widths(state_data))
+
+    workbook.close()
+    return output
+
+
+OVERVIEW_COLUMNS = [
+    ('State', 12, 'data'),
+    ('Total Lost Customers', 20, 'data'),
+    ('Average MT per Customer', 22, 'number'),
+    ('Recovery Potential (MT/month)', 25, 'currency'),
+    ('Problems Analyzed', 18, 'data'),
+    ('Highest Impact Problem', 35, 'data')
+]
+
+
+def sheet_title(state, suffix, used=None):
+    """Excel-safe worksheet name (max 31 chars, no []:*?/\\); the state is shortened, never the suffix.
+
+    Names in ``used`` (lowercase, as Excel compares them) get a number
+    after the suffix; the new name is added to it.
+    """
+    state = ''.join('_' if ch in '[]:*?/\\' else ch for ch in str(state))
+    name = f"{state[:31 - len(suffix) - 1]} {suffix}"
+    number = 1
+    while used is not None and name.lower() in used:
+        number += 1
+        numbered = f"{suffix} {number}"
+        name = f"{state[:31 - len(numbered) - 1]} {numbered}"
+    if used is not None:
+        used.add(name.lower())
+    return name
+
+
+def write_multi_state_report(output, state_sheets, generated_at, total=None, progress=None):
+    """Write a workbook covering several states to ``output``.
+
+    ``state_sheets`` yields one prepared payload per state, in sheet order
+    (see ``export_jobs.build_state_sheets``); each state's sheets are
+    written as soon as its payload arrives. An Overview sheet lists every
+    state ahead of an Analysis and a Raw Data sheet per state; its rows are
+    filled in last. ``total`` is the number of states when ``state_sheets``
+    is not a sequence. ``progress(written)`` is called after each state.
+    """
+    import xlsxwriter
+
+    total = len(state_sheets) if total is None else total
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'nan_inf_to_errors': True})
+    formats = _add_formats(workbook)
+
+    # Every worksheet streams to its own temporary file, so the Overview
+    # can be added first and written after the states
+    overview = []
+    titles = {'overview'}
+    _table_sheet(workbook, formats, 'Overview', f'Recovery Analysis Report - {total} States '
+                 f'({generated_at})', OVERVIEW_COLUMNS, overview)
+
+    for written, sheets in enumerate(state_sheets, start=1):
+        state = sheets['state']
+        overview.append((state, sheets['summary']['total_lost'], sheets['summary']['avg_mt'],
+                         sheets['calculations']['total_mt'], len(sheets['calculations']['problems']),
+                         sheets['summary']['highest_loss_reason']))
+        if sheets['analysis_rows']:
+            _table_sheet(workbook, formats, sheet_title(state, 'Analysis', titles),
+                         f'Detailed Recovery Potential Analysis - {state}',
+                         ANALYSIS_COLUMNS, sheets['analysis_rows'])
+        _raw_sheet(workbook, formats, sheet_title(state, 'Raw Data', titles), f'Raw Data for {state}',
+                   sheets['raw_columns'], sheets['raw_rows'], sheets['raw_widths'])
+        if progress is not None:
+            progress(written)
+
+    _table_rows(workbook.get_worksheet_by_name('Overview'), formats, OVERVIEW_COLUMNS, overview)
+    workbook.close()
+    return output
@@ -0,0 +1,232 @@
+"""Background multi-state export jobs.
+
+Exports covering several states run outside the request thread. Each
+state's sheet rows (recovery analysis, summary and raw rows) are prepared
+in parallel in a local process pool. A coordinator thread writes the
+combined workbook in one constant_memory pass, each state's sheets as soon
+as that state and the ones before it are ready, so the write overlaps the
+preparation of the later states, and caches it on disk.
+
+Job status is kept as a small JSON file next to the workbook, so progress
+polls and downloads work from any gunicorn worker, not just the one that
+started the job. The coordinator rewrites it every ``heartbeat`` seconds
+while the job runs; a running job whose status is older than a few
+heartbeats died with its worker and is reported as failed. A job is
+identified by its inputs (states, data version, slider rates), so
+re-requesting the same export reuses the cached workbook.
+
+The process running a job holds an flock on ``<job>.lock`` until it
+finishes, so two workers asked for the same export do not both run it;
+the kernel drops the lock of a worker that died, and the job can then be
+started again.
+"""
+import concurrent.futures
+import fcntl
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from data_loader import expand_frame
+from data_store import StateIndex
+from excel_report import analysis_rows, raw_column_widths, write_multi_state_report
+from recovery_engine import recovery_payload
+
+logger = logging.getLogger(__name__)
+
+
+def build_state_sheets(state, state_data, top_n, slider_values):
+    """Sheet payload for one state; runs in a pool process"""
+    index = StateIndex(state_data, version=state, top_n=top_n)
+    state_data = expand_frame(state_data)
+    calculations = recovery_payload(
+        state,
+        index.top_problems(state)['Lost Reason'].tolist(),
+        index.top_customers[state],
+        slider_values,
+        index.avg_mt(state)
+    )
+    return {
+        'state': state,
+        'summary': index.summary(state),
+        'calculations': calculations,
+        'analysis_rows': analysis_rows(calculations),
+        'raw_columns': [str(col) for col in state_data.columns],
+        'raw_rows': list(state_data.itertuples(index=False, name=None)),
+        'raw_widths': raw_column_widths(state_data)
+    }
+
+
+def job_key(states, version, slider_values):
+    """Stable job id for an export of ``states`` at a data version and slider setting"""
+    payload = json.dumps([sorted(states), version, list(slider_values)])
+    return hashlib.sha1(payload.encode()).hexdigest()[:20]
+
+
+class ExportJobRunner:
+    """Runs multi-state export jobs in a process pool and caches workbooks on disk"""
+
+    def __init__(self, directory, max_workers=None, max_cached=50, heartbeat=5.0):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.max_cached = max_cached
+        self.heartbeat = heartbeat
+        self._pool = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: never fork a threaded server process
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def workbook_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.xlsx")
+
+    def _status_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _lock_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.lock")
+
+    def _temp_file(self, job_id):
+        """(fd, path) of a new temporary file for ``job_id``, unique per writer"""
+        return tempfile.mkstemp(dir=self.directory, prefix=f'.{job_id}.', suffix='.tmp')
+
+    def _claim(self, job_id):
+        """File descriptor holding the job's lock, or None while another run holds it"""
+        fd = os.open(self._lock_path(job_id), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _write_status(self, job_id, **status):
+        fd, tmp = self._temp_file(job_id)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(dict(status, updated=time.time()), fh)
+        os.replace(tmp, self._status_path(job_id))
+
+    def status(self, job_id):
+        """Job status dict (``status``, ``done``, ``written``, ``total``, ...) or None for unknown jobs.
+
+        A running job whose heartbeat stopped is reported as failed.
+        """
+        try:
+            with open(self._status_path(job_id)) as fh:
+                status = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+        if status['status'] == 'running' and time.time() - status['updated'] > 3 * self.heartbeat:
+            status.update(status='failed', error="the export stopped responding; start it again")
+        return status
+
+    def submit(self, index, states, slider_values):
+        """Start (or reuse) an export of ``states`` from a StateIndex snapshot; returns the job id"""
+        states = [state for state in states if state in index]
+        job_id = job_key(states, index.version, slider_values)
+        claim = self._claim(job_id)
+        if claim is None:
+            # Running in this or another worker
+            return job_id
+        try:
+            current = self.status(job_id)
+            if current is not None and current['status'] == 'done' and os.path.exists(self.workbook_path(job_id)):
+                os.close(claim)
+                return job_id
+            self._write_status(job_id, status='running', done=0, written=0, total=len(states), states=states)
+            executor = self._executor()
+            futures = {
+                executor.submit(build_state_sheets, state, index.partition(state), index.top_n,
+                                list(slider_values)): state
+                for state in states
+            }
+            threading.Thread(target=self._finish, args=(job_id, states, futures, claim),
+                             name=f'export-{job_id}', daemon=True).start()
+        except BaseException:
+            os.close(claim)
+            raise
+        return job_id
+
+    def _finish(self, job_id, states, futures, claim):
+        progress = {'status': 'running', 'done': 0, 'written': 0, 'total': len(states), 'states': states}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def update(**changes):
+            with lock:
+                progress.update(changes)
+                self._write_status(job_id, **progress)
+
+        def beat():
+            while not stop.wait(self.heartbeat):
+                update()
+
+        def prepared(future):
+            with lock:
+                progress['done'] += 1
+
+        threading.Thread(target=beat, name=f'export-{job_id}-heartbeat', daemon=True).start()
+        try:
+            for future in futures:
+                future.add_done_callback(prepared)
+            by_state = {state: future for future, state in futures.items()}
+            fd, tmp = self._temp_file(job_id)
+            try:
+                with os.fdopen(fd, 'wb') as fh:
+                    write_multi_state_report(fh, (by_state[state].result() for state in states),
+                                             datetime.now().strftime("%Y-%m-%d %H:%M:%S"), total=len(states),
+                                             progress=lambda written: update(written=written))
+                os.replace(tmp, self.workbook_path(job_id))
+            except BaseException:
+                os.remove(tmp)
+                raise
+            stop.set()
+            update(status='done', done=len(states), written=len(states))
+            self._prune()
+        except Exception as exc:
+            stop.set()
+            if isinstance(exc, concurrent.futures.process.BrokenProcessPool):
+                # A pool process died; start a fresh pool for the next job
+                with self._lock:
+                    self._pool = None
+            logger.exception("Export job %s failed", job_id)
+            update(status='failed', error=str(exc))
+        finally:
+            os.close(claim)
+
+    def _prune(self):
+        """Drop the oldest cached workbooks beyond ``max_cached``"""
+        workbooks = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith('.xlsx')),
+            key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in workbooks[self.max_cached:]:
+            job_id = entry.name[:-len('.xlsx')]
+            claim = self._claim(job_id)
+            if claim is None:
+                # Being exported again
+                continue
+            try:
+                for path in (entry.path, self._status_path(job_id), self._lock_path(job_id)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            finally:
+                os.close(claim)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,152 @@
+"""Concurrent rendering of a scenario's single-state export files.
+
+A download of one format (Excel workbook, JSON document) starts every
+format of that scenario at once in a small thread pool and waits for the
+one asked for; the others are then ready, or in flight, when their link
+is clicked. Rendered files, served or not, are kept up to ``max_bytes``
+in total, least recently requested dropped first, so each (state,
+scenario) file is rendered once while it stays in use.
+
+A renderer gets a ``stage`` context manager and reports its time per
+stage (calculation, xlsx, json, ...); the timings of each file come back
+with it and are summed per stage in ``stats``.
+
+``dumps`` serializes export documents with orjson when it is installed,
+numpy values included, and with the standard library otherwise.
+"""
+import concurrent.futures
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_default(obj):
+    """numpy scalars and arrays for json.dumps; only called for unknown types"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Indented JSON bytes of ``obj``; numpy scalars and arrays are serialized natively"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, indent=2, default=_json_default).encode()
+
+
+class _Stages:
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+
+class ExportPipeline:
+    """Renders the formats of an export key concurrently in a thread pool.
+
+    ``renderers`` maps a format to ``render(*key, *args, stage)`` returning
+    bytes; ``args`` are those of the ``result`` call that started the render
+    and are not part of the key.
+    """
+
+    def __init__(self, renderers, max_workers=None, max_bytes=64 * 1024 * 1024):
+        self.renderers = renderers
+        self.max_workers = max_workers or len(renderers)
+        self.max_bytes = max_bytes
+        self._pool = None
+        # (key, format) -> future, least recently requested first; _sizes holds the finished ones' bytes
+        self._futures = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._stage_seconds = {}
+        self._renders = {}
+        self.dropped = 0
+
+    def _executor(self):
+        # Created on first use: no threads before a gunicorn fork
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                               thread_name_prefix='export')
+        return self._pool
+
+    def _submit(self, key, fmt, args):
+        """``(future, started)`` of a file; ``started`` when no render was kept or in flight"""
+        with self._lock:
+            future = self._futures.get((key, fmt))
+            # A failed render is retried on the next request
+            if future is not None and not (future.done() and future.exception() is not None):
+                self._futures.move_to_end((key, fmt))
+                return future, False
+            self._sizes.pop((key, fmt), None)
+            future = self._futures[(key, fmt)] = self._executor().submit(self._render, key, fmt, args)
+            return future, True
+
+    def _render(self, key, fmt, args):
+        stages = _Stages()
+        payload = self.renderers[fmt](*key, *args, stages)
+        with self._lock:
+            self._renders[fmt] = self._renders.get(fmt, 0) + 1
+            for name, seconds in stages.seconds.items():
+                self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + seconds
+            if (key, fmt) in self._futures:
+                self._sizes[(key, fmt)] = len(payload)
+                self._evict()
+        return payload, stages.seconds
+
+    def _evict(self):
+        """Drop the least recently requested finished files beyond ``max_bytes``; caller holds the lock"""
+        total = sum(self._sizes.values())
+        for entry in list(self._futures):
+            if total <= self.max_bytes:
+                break
+            if entry in self._sizes:
+                total -= self._sizes.pop(entry)
+                del self._futures[entry]
+                self.dropped += 1
+
+    def result(self, key, fmt, *args):
+        """``(payload, stage seconds)`` of one format, rendering the key's other formats alongside.
+
+        The timings are those of the render when this call found it in
+        flight, plus 'wait': the time this call spent waiting for it.
+        """
+        start = time.perf_counter()
+        future, started = self._submit(key, fmt, args)
+        if started:
+            for other in self.renderers:
+                if other != fmt:
+                    self._submit(key, other, args)
+        cached = future.done()
+        payload, seconds = future.result()
+        return payload, {**({} if cached else seconds), 'wait': time.perf_counter() - start}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'renders': dict(self._renders),
+                'stage_seconds': dict(self._stage_seconds),
+                'entries': len(self._futures),
+                'bytes': sum(self._sizes.values()),
+                'max_bytes': self.max_bytes,
+                'dropped': self.dropped
+            }
+
+
+def server_timing(seconds):
+    """Server-Timing header value for per-stage seconds"""
+    return ', '.join(f"{name};dur={value * 1000:.1f}" for name, value in seconds.items())
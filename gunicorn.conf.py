@@ -0,0 +1,58 @@
+"""Gunicorn hooks for the recovery dashboard (``gunicorn app:server``).
+
+With RECOVERY_SHARED_DATA=1 the master loads the lost-deals table once
+and publishes it as memory-mapped columns (shared_data.py); workers attach
+to it instead of each loading and indexing their own copy, so resident
+memory stays flat as workers are added. The master starts no threads.
+
+One live worker at a time is the primary (primary.py): it holds a lock
+file in the cache directory and is the one that writes the monthly history
+and, with shared data, polls the source and publishes reloads. The other
+workers keep retrying the lock, so one of them takes over when the primary
+exits, including on a SIGHUP reload.
+"""
+import os
+import shutil
+import tempfile
+
+SHARED_DATA = os.environ.get('RECOVERY_SHARED_DATA', '0') == '1'
+
+# Set when the master picked the directory itself and should remove it on exit
+_owned_dir = None
+
+
+def on_starting(server):
+    global _owned_dir
+    # Inherited by the workers; app.py elects the primary with it
+    cache_dir = os.environ.get('RECOVERY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'recovery-dashboard'))
+    os.environ.setdefault('RECOVERY_PRIMARY_LOCK', os.path.join(cache_dir, 'primary-worker.lock'))
+    if not SHARED_DATA:
+        return
+
+    from data_loader import open_source
+    from dataset import load_lost_deals
+    from shared_data import SharedDataStore
+
+    # tmpfs where available: the mapped columns never touch a disk
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    directory = os.environ.get('RECOVERY_SHARED_DATA_DIR')
+    if not directory:
+        directory = _owned_dir = os.path.join(base, f'recovery-dashboard-{os.getpid()}')
+    source_path = os.environ.get('RECOVERY_DATA_SOURCE')
+    source = open_source(
+        source_path,
+        table=os.environ.get('RECOVERY_DATA_TABLE', 'lost_deals'),
+        watermark=os.environ.get('RECOVERY_DATA_WATERMARK', 'rowid')
+    ) if source_path else None
+    compact = os.environ.get('RECOVERY_COMPACT_DATA', '1') == '1'
+    top_n = int(os.environ.get('RECOVERY_TOP_PROBLEMS', '3'))
+
+    store = SharedDataStore(load_lost_deals(source, compact=compact), directory, top_n=top_n)
+    # Inherited by the workers; app.py attaches when it is set
+    os.environ['RECOVERY_SHARED_DATA_DIR'] = directory
+    server.log.info("Published lost-deals data version %s to %s", store.version, directory)
+
+
+def on_exit(server):
+    if _owned_dir is not None:
+        shutil.rmtree(_owned_dir, ignore_errors=True)
@@ -0,0 +1,174 @@
+"""Monthly history of the lost-deals table in SQLite.
+
+The fact table holds one row per (month, state, lost reason) with the
+priority counts. Its primary key starts with the month and the table is
+WITHOUT ROWID, so rows are stored clustered by month: a date-range query
+reads only the pages of the months in the range, however many years are
+kept; a covering index on (state, month, reason, total_lost) does the
+same for one state's reason totals.
+``monthly_totals`` caches the per-(month, state) aggregates the
+trend charts need; it is rewritten together with the months it covers.
+
+Snapshots are recorded per month (``record_snapshot``): the dashboard
+records the live table as the current month on load and on every reload,
+so one month's partition always holds that month's latest data. Older
+months can be backfilled from a file with a Month column:
+
+    python -m history history.sqlite3 backfill.csv
+
+Every write bumps a generation number. Query results are cached per
+process, keyed by that number, so any process writing the file
+invalidates them everywhere.
+"""
+import argparse
+import functools
+
+import pandas as pd
+
+from data_store import PRIORITIES
+from months import month_key
+from sqlite_db import connect, create
+
+COUNT_COLUMNS = ['total_lost'] + [priority.lower() for priority in PRIORITIES]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS lost_deals_history (
+    month TEXT NOT NULL,
+    state TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    {', '.join(f'{column} INTEGER NOT NULL' for column in COUNT_COLUMNS)},
+    PRIMARY KEY (month, state, reason)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_state_month ON lost_deals_history (state, month, reason, total_lost);
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    month TEXT NOT NULL,
+    state TEXT NOT NULL,
+    reasons INTEGER NOT NULL,
+    {', '.join(f'{column} INTEGER NOT NULL' for column in COUNT_COLUMNS)},
+    PRIMARY KEY (month, state)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class HistoryStore:
+    """Month-partitioned lost-deals history in one SQLite file, shared by all processes"""
+
+    def __init__(self, path):
+        self.path = path
+        create(path, SCHEMA)
+
+    def _meta(self, conn, key):
+        row = conn.execute('SELECT value FROM history_meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def generation(self):
+        with connect(self.path) as conn:
+            return int(self._meta(conn, 'generation') or 0)
+
+    def record_snapshot(self, frame, month, states=None, version=None):
+        """Replace ``month``'s rows of ``states`` (default: all in ``frame``) with ``frame``'s.
+
+        Rows are stored per (state, lost reason), summed over any detail rows.
+
+        With a data ``version``, a snapshot of that version already recorded
+        for the month is skipped. Returns whether anything was written.
+        """
+        if states is None:
+            states = list(pd.unique(frame['State'].astype(str)))
+        states = [str(state) for state in states]
+        rows = frame[frame['State'].astype(str).isin(states)]
+        # Detail rows (District/Rep columns) are summed to one row per reason
+        rows = rows.groupby(['State', 'Lost Reason'], observed=True, sort=False)[
+            ['Total Lost'] + PRIORITIES].sum().reset_index()
+        records = list(zip(
+            [month] * len(rows),
+            rows['State'].astype(str).tolist(),
+            rows['Lost Reason'].astype(str).tolist(),
+            *[rows[column].astype('int64').tolist() for column in ['Total Lost'] + PRIORITIES]
+        ))
+        with connect(self.path) as conn:
+            if version is not None and self._meta(conn, f'snapshot:{month}') == version:
+                return False
+            placeholders = ','.join('?' * len(states))
+            conn.execute(f'DELETE FROM lost_deals_history WHERE month = ? AND state IN ({placeholders})',
+                         [month, *states])
+            conn.execute(f'DELETE FROM monthly_totals WHERE month = ? AND state IN ({placeholders})',
+                         [month, *states])
+            conn.executemany(
+                f"INSERT INTO lost_deals_history (month, state, reason, {', '.join(COUNT_COLUMNS)}) "
+                f"VALUES ({','.join('?' * (3 + len(COUNT_COLUMNS)))})",
+                records
+            )
+            conn.execute(
+                f"INSERT INTO monthly_totals (month, state, reasons, {', '.join(COUNT_COLUMNS)}) "
+                f"SELECT month, state, COUNT(*), {', '.join(f'SUM({column})' for column in COUNT_COLUMNS)} "
+                f"FROM lost_deals_history WHERE month = ? AND state IN ({placeholders}) GROUP BY month, state",
+                [month, *states]
+            )
+            if version is not None:
+                conn.execute('INSERT OR REPLACE INTO history_meta VALUES (?, ?)', (f'snapshot:{month}', version))
+            conn.execute("INSERT OR REPLACE INTO history_meta VALUES ('generation', ?)",
+                         (str(int(self._meta(conn, 'generation') or 0) + 1),))
+        return True
+
+    def import_frame(self, frame, month_column='Month'):
+        """Backfill from a table with a month column; each month present is replaced"""
+        months = frame[month_column].map(month_key)
+        for month, part in frame.groupby(months, sort=True):
+            self.record_snapshot(part, month)
+        return sorted(months.unique())
+
+    def months(self):
+        return self._months(self.generation())
+
+    @functools.lru_cache(maxsize=8)
+    def _months(self, generation):
+        with connect(self.path) as conn:
+            return [row[0] for row in conn.execute('SELECT DISTINCT month FROM monthly_totals ORDER BY month')]
+
+    def monthly_totals(self, start, end, states=None):
+        """Per (month, state) totals for months ``start``..``end`` ('YYYY-MM', inclusive)"""
+        return self._monthly_totals(self.generation(), start, end, tuple(states) if states else None)
+
+    @functools.lru_cache(maxsize=64)
+    def _monthly_totals(self, generation, start, end, states):
+        query = 'SELECT * FROM monthly_totals WHERE month BETWEEN ? AND ?'
+        params = [start, end]
+        if states:
+            query += f" AND state IN ({','.join('?' * len(states))})"
+            params += list(states)
+        with connect(self.path) as conn:
+            return pd.read_sql_query(query + ' ORDER BY month, state', conn, params=params)
+
+    def reason_totals(self, start, end, state):
+        """Total Lost per lost reason of ``state`` over months ``start``..``end``, largest first"""
+        return self._reason_totals(self.generation(), start, end, state)
+
+    @functools.lru_cache(maxsize=64)
+    def _reason_totals(self, generation, start, end, state):
+        # Answered from the (state, month, reason, total_lost) index alone
+        query = (
+            "SELECT reason, COUNT(*) AS months, SUM(total_lost) AS total_lost "
+            "FROM lost_deals_history WHERE state = ? AND month BETWEEN ? AND ? "
+            "GROUP BY reason ORDER BY total_lost DESC"
+        )
+        with connect(self.path) as conn:
+            return pd.read_sql_query(query, conn, params=[state, start, end])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill the lost-deals history from a file with a Month column')
+    parser.add_argument('database')
+    parser.add_argument('path', help='CSV or Parquet file: Month, State, Lost Reason, Total Lost, P1-P4')
+    args = parser.parse_args()
+    frame = pd.read_parquet(args.path) if args.path.endswith(('.parquet', '.pq')) else pd.read_csv(args.path)
+    months = HistoryStore(args.database).import_frame(frame)
+    print(f"Recorded {len(months)} months: {months[0]} .. {months[-1]}" if months else "No rows")
+
+
+if __name__ == '__main__':
+    main()
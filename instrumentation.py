@@ -0,0 +1,193 @@
+"""Opt-in per-callback latency and payload metrics.
+
+``CallbackMetrics.instrument`` wraps a Dash callback function; with
+metrics disabled it returns the function unchanged. For every
+``/_dash-update-component`` request that runs an instrumented callback
+it records:
+
+* wall time of the whole request,
+* compute time of the callback function,
+* time in named stages inside the callback (``with metrics.stage('pandas')``),
+* serialization time: wall time minus compute time, i.e. Dash decoding
+  the request and encoding the response,
+* response bytes.
+
+``prometheus_text`` renders the counters and histograms in the
+Prometheus text exposition format, plus hit/miss/eviction counters of
+any FileCache passed in. Metrics are per process; with several
+gunicorn workers each worker reports its own.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+DISPATCH_PATH = '/_dash-update-component'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+
+class _CallbackStats:
+    def __init__(self):
+        self.wall = Histogram(SECONDS_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.compute = 0.0
+        self.serialize = 0.0
+        self.stages = {}
+        self.max_wall = 0.0
+
+
+class CallbackMetrics:
+    """Per-callback wall, compute, stage and serialization time plus response size"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def instrument(self, func):
+        """Decorator recording ``func``'s compute time for the current request"""
+        if not self.enabled:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            record = {'callback': func.__name__, 'stages': {}, 'compute': 0.0}
+            self._local.record = record
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record['compute'] = time.perf_counter() - start
+
+        return wrapper
+
+    @contextmanager
+    def stage(self, name):
+        """Attribute the enclosed time to stage ``name`` of the running callback"""
+        record = getattr(self._local, 'record', None) if self.enabled else None
+        if record is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['stages'][name] = record['stages'].get(name, 0.0) + time.perf_counter() - start
+
+    def install(self, server):
+        """Time Dash callback requests on a Flask ``server``"""
+        if not self.enabled:
+            return
+
+        @server.before_request
+        def _start_timer():
+            from flask import g, request
+
+            if request.path.endswith(DISPATCH_PATH):
+                self._local.record = None
+                g.callback_started = time.perf_counter()
+
+        @server.after_request
+        def _record(response):
+            from flask import g
+
+            started = g.pop('callback_started', None)
+            record = getattr(self._local, 'record', None)
+            if started is not None and record is not None:
+                self._local.record = None
+                size = response.calculate_content_length()
+                if size is None:
+                    size = len(response.get_data())
+                self.observe(record, time.perf_counter() - started, size)
+            return response
+
+    def observe(self, record, wall, response_bytes):
+        with self._lock:
+            stats = self._stats.setdefault(record['callback'], _CallbackStats())
+            stats.wall.observe(wall)
+            stats.response_bytes.observe(response_bytes)
+            stats.compute += record['compute']
+            stats.serialize += max(wall - record['compute'], 0.0)
+            stats.max_wall = max(stats.max_wall, wall)
+            for name, seconds in record['stages'].items():
+                stats.stages[name] = stats.stages.get(name, 0.0) + seconds
+
+    def snapshot(self):
+        """Per-callback averages, slowest callbacks first"""
+        with self._lock:
+            rows = []
+            for name, stats in self._stats.items():
+                calls = stats.wall.count
+                rows.append({
+                    'callback': name,
+                    'calls': calls,
+                    'avg_ms': stats.wall.sum / calls * 1000,
+                    'max_ms': stats.max_wall * 1000,
+                    'compute_ms': stats.compute / calls * 1000,
+                    'serialize_ms': stats.serialize / calls * 1000,
+                    'stages_ms': {stage: seconds / calls * 1000 for stage, seconds in stats.stages.items()},
+                    'avg_bytes': stats.response_bytes.sum / calls
+                })
+        return sorted(rows, key=lambda row: row['avg_ms'], reverse=True)
+
+    def prometheus_text(self, caches=None):
+        """Prometheus exposition text; ``caches`` maps a label to a FileCache"""
+        lines = []
+
+        def histogram(metric, help_text, attr, buckets):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, stats in sorted(self._stats.items()):
+                hist = getattr(stats, attr)
+                cumulative = 0
+                for bound, count in zip(buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{callback="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{callback="{name}",le="+Inf"}} {hist.count}')
+                lines.append(f'{metric}_sum{{callback="{name}"}} {hist.sum}')
+                lines.append(f'{metric}_count{{callback="{name}"}} {hist.count}')
+
+        def counter(metric, help_text, values):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in values:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f'{metric}{{{label_text}}} {value}')
+
+        with self._lock:
+            histogram('dash_callback_seconds', 'Wall time of Dash callback requests.',
+                      'wall', SECONDS_BUCKETS)
+            histogram('dash_callback_response_bytes', 'Response size of Dash callback requests.',
+                      'response_bytes', BYTES_BUCKETS)
+            stats = sorted(self._stats.items())
+            counter('dash_callback_compute_seconds_total', 'Time spent in the callback function.',
+                    [((('callback', name),), s.compute) for name, s in stats])
+            counter('dash_callback_serialize_seconds_total',
+                    'Request time outside the callback function (request decoding, response encoding).',
+                    [((('callback', name),), s.serialize) for name, s in stats])
+            counter('dash_callback_stage_seconds_total', 'Time spent in named stages inside callbacks.',
+                    [((('callback', name), ('stage', stage)), seconds)
+                     for name, s in stats for stage, seconds in sorted(s.stages.items())])
+        cache_stats = sorted((name, cache.stats()) for name, cache in (caches or {}).items())
+        for field in ('hits', 'misses', 'evictions', 'expirations'):
+            counter(f'recovery_cache_{field}_total', f'Cache {field} in this process.',
+                    [((('cache', name),), stats[field]) for name, stats in cache_stats])
+        return '\n'.join(lines) + '\n'
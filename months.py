@@ -0,0 +1,13 @@
+"""Calendar months as 'YYYY-MM' keys."""
+from datetime import date
+
+import pandas as pd
+
+
+def month_key(value):
+    """'YYYY-MM' for a date, timestamp or date string"""
+    return pd.Timestamp(value).strftime('%Y-%m')
+
+
+def current_month():
+    return month_key(date.today())
@@ -0,0 +1,88 @@
+"""One primary process among the gunicorn workers, chosen by a lock file.
+
+The primary writes the monthly history and, with shared data, polls the
+source and publishes reloads. Every worker tries to take the lock when it
+starts and again every ``interval`` seconds until it holds it, so when
+the primary exits (a crash, a max_requests restart, a SIGHUP reload that
+replaced every worker) one of the others takes over within an interval.
+The kernel releases the lock when the holding process exits.
+"""
+import fcntl
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PrimaryLock:
+    """Exclusive, non-blocking flock on ``path``, held until the process exits"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Take the lock if no other process holds it; returns whether this process holds it"""
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+
+class PrimaryElection:
+    """Retries a PrimaryLock in a daemon thread and calls ``on_primary`` once it is held"""
+
+    def __init__(self, lock, on_primary, interval=30.0):
+        self.lock = lock
+        self.on_primary = on_primary
+        self.interval = interval
+        self.promoted = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def try_once(self):
+        """Take the lock if it is free; True once this process is the primary"""
+        if self.promoted:
+            return True
+        if not self.lock.acquire():
+            return False
+        # Retried on the next attempt if it fails; the lock stays held
+        self.on_primary()
+        self.promoted = True
+        logger.info("Process %s is the primary", os.getpid())
+        return True
+
+    def _attempt(self):
+        try:
+            return self.try_once()
+        except Exception:
+            logger.exception("Taking over as the primary failed")
+            return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._attempt():
+                return
+
+    def start(self):
+        if not self._attempt():
+            self._thread = threading.Thread(target=self._run, name='primary-election', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
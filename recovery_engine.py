@@ -0,0 +1,92 @@
+"""Vectorized recovery-potential math.
+
+``customers`` is the (problems x priorities) matrix of lost customers for a
+state's top problems. ``rates`` are conversion rates in percent, either one
+(problems x priorities) slider matrix or a (scenarios x problems x
+priorities) batch.
+"""
+import numpy as np
+
+
+def compute_recovery(customers, rates, avg_mt):
+    """Per-cell, per-problem and grand-total recovery for one slider matrix.
+
+    Also broadcasts over leading scenario axes of ``rates``; use
+    ``evaluate_scenarios`` when only the totals of a large batch are needed.
+    """
+    customers = np.asarray(customers, dtype=float)
+    rates = np.asarray(rates, dtype=float)
+    potential_customers = customers * (rates / 100)
+    potential_mt = potential_customers * avg_mt
+    problem_totals = potential_mt.sum(axis=-1)
+    return {
+        'potential_customers': potential_customers,
+        'potential_mt': potential_mt,
+        'problem_totals': problem_totals,
+        'total_mt': problem_totals.sum(axis=-1)
+    }
+
+
+def evaluate_scenarios(customers, rates, avg_mt, chunk_size=65536):
+    """Per-problem and grand totals for a batch of slider matrices.
+
+    ``rates`` has shape (scenarios, problems, priorities). Scenarios are
+    contracted against ``customers`` in chunks, so no
+    scenarios x problems x priorities temporary is built beyond the input.
+    ``rates`` can also be any object with a ``shape`` whose slices are
+    arrays, such as rates drawn chunk by chunk as they are sliced.
+    Returns ``(problem_totals, total_mt)`` with shapes (scenarios, problems)
+    and (scenarios,).
+    """
+    customers = np.asarray(customers, dtype=float)
+    if not hasattr(rates, 'shape'):
+        rates = np.asarray(rates)
+    scale = avg_mt / 100
+    problem_totals = np.empty(rates.shape[:2])
+    for start in range(0, len(rates), chunk_size):
+        chunk = rates[start:start + chunk_size]
+        problem_totals[start:start + chunk_size] = np.einsum('spk,pk->sp', chunk, customers) * scale
+    return problem_totals, problem_totals.sum(axis=1)
+
+
+def _slider_value(value, default=50):
+    return default if value is None else value
+
+
+def rate_matrix(slider_values, problems, priorities=4, default=50):
+    """Reshape a flat slider list into a (problems x priorities) rate matrix.
+
+    Missing (``None``) sliders use ``default``; only problems with a full set
+    of sliders are included.
+    """
+    problems = min(problems, len(slider_values) // priorities)
+    values = [_slider_value(v, default) for v in slider_values[:problems * priorities]]
+    return np.asarray(values, dtype=float).reshape(problems, priorities)
+
+
+def recovery_payload(state, problem_names, customers, slider_values, avg_mt, priorities=('P1', 'P2', 'P3', 'P4')):
+    """calculations-store payload for a state's top problems at the given sliders.
+
+    ``slider_values`` is the flat problem-major list of slider values;
+    ``customers`` the (problems x priorities) matrix they apply to.
+    """
+    rates = rate_matrix(slider_values, len(problem_names), len(priorities))
+    customers = customers[:len(rates)]
+    recovery = compute_recovery(customers, rates, avg_mt)
+    problems = []
+    for problem_idx in range(len(rates)):
+        problems.append({
+            'name': problem_names[problem_idx],
+            'priorities': [
+                {
+                    'priority': priority,
+                    'customers': customers[problem_idx, i].item(),
+                    'conversion_rate': _slider_value(slider_values[problem_idx * len(priorities) + i]),
+                    'potential_customers': recovery['potential_customers'][problem_idx, i].item(),
+                    'potential_mt': recovery['potential_mt'][problem_idx, i].item()
+                }
+                for i, priority in enumerate(priorities)
+            ],
+            'total_mt': recovery['problem_totals'][problem_idx].item()
+        })
+    return {'state': state, 'problems': problems, 'total_mt': recovery['total_mt'].item()}
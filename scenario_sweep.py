@@ -0,0 +1,206 @@
+"""Conversion-rate sensitivity sweeps over each state's top problems.
+
+Two scenario spaces, both on the sliders' step grid:
+
+* ``grid``        - every combination of one rate per priority (P1..P4),
+                    applied to all of a state's top problems; 21**4 =
+                    194,481 scenarios at 5% steps. Scenario ``i`` has the
+                    same rates in every state, so totals also add up across
+                    states.
+* ``monte_carlo`` - ``samples`` independent draws of every slider
+                    (problem x priority), per state. Draws are made chunk
+                    by chunk as they are evaluated and are not kept; the
+                    rates of the top-N are drawn again from their chunk's
+                    seed.
+
+Scenarios are evaluated with ``recovery_engine.evaluate_scenarios`` in
+vectorized chunks; only the totals are kept, summarized as a distribution
+plus the top-N scenarios. Recovery grows with every rate, so the top-N are
+ranked among scenarios whose mean slider rate stays within
+``max_mean_rate``: the best way to spend a given conversion effort.
+
+``MAX_SCENARIOS`` caps the scenarios of one sweep and ``MAX_CELLS`` its
+scenarios x problems, the size of the per-problem totals it keeps.
+"""
+import time
+
+import numpy as np
+
+from data_store import PRIORITIES
+from recovery_engine import evaluate_scenarios
+
+SWEEP_MODES = ('grid', 'monte_carlo')
+MAX_SCENARIOS = 2_000_000
+MAX_CELLS = 6_000_000
+SAMPLE_CHUNK = 65536
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def rate_levels(step=5, low=0, high=100):
+    if step <= 0 or not 0 <= low <= high <= 100:
+        raise ValueError("Rates need 0 <= low <= high <= 100 and a positive step")
+    return np.arange(low, high + 1, step, dtype=np.uint8)
+
+
+def grid_rates(priorities=len(PRIORITIES), step=5, low=0, high=100):
+    """(scenarios x priorities) array of every per-priority rate combination"""
+    levels = rate_levels(step, low, high)
+    if len(levels) ** priorities > MAX_SCENARIOS:
+        raise ValueError(f"Grid of {len(levels) ** priorities:,} scenarios exceeds {MAX_SCENARIOS:,}")
+    mesh = np.meshgrid(*[levels] * priorities, indexing='ij')
+    return np.stack([axis.ravel() for axis in mesh], axis=1)
+
+
+class SampledRates:
+    """(samples x problems x priorities) independently drawn slider rates, drawn when sliced.
+
+    Each chunk of ``chunk_size`` samples has its own seed, so slicing the
+    same samples again gives the same rates. The mean rate of every sample
+    is kept as its chunk is drawn.
+    """
+
+    def __init__(self, samples, problems, priorities, levels, seed=None, chunk_size=SAMPLE_CHUNK):
+        self.shape = (samples, problems, priorities)
+        self.levels = levels
+        self.chunk_size = chunk_size
+        self.entropy = np.random.SeedSequence(seed).entropy
+        self.mean_rates = np.full(samples, np.nan)
+        self._last = (None, None)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _chunk(self, number):
+        if self._last[0] != number:
+            size = min(self.chunk_size, self.shape[0] - number * self.chunk_size)
+            rng = np.random.default_rng(np.random.SeedSequence(self.entropy, spawn_key=(number,)))
+            draws = rng.integers(0, len(self.levels), size=(size,) + self.shape[1:], dtype=np.uint8)
+            chunk = self.levels[draws]
+            start = number * self.chunk_size
+            self.mean_rates[start:start + size] = chunk.reshape(size, -1).mean(axis=1)
+            self._last = (number, chunk)
+        return self._last[1]
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            item = int(item)
+            return self._chunk(item // self.chunk_size)[item % self.chunk_size]
+        start, stop, step = item.indices(len(self))
+        if step != 1:
+            raise IndexError("Sampled rates are sliced in order")
+        if start >= stop:
+            return np.empty((0,) + self.shape[1:], dtype=self.levels.dtype)
+        first, last = start // self.chunk_size, (stop - 1) // self.chunk_size
+        chunks = [self._chunk(number) for number in range(first, last + 1)]
+        rows = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        offset = first * self.chunk_size
+        return rows[start - offset:stop - offset]
+
+
+def sample_rates(samples, problems, priorities=len(PRIORITIES), step=5, low=0, high=100, seed=None):
+    """SampledRates of ``samples`` independent draws of every slider"""
+    if not 0 < samples <= MAX_SCENARIOS:
+        raise ValueError(f"Samples must be between 1 and {MAX_SCENARIOS:,}")
+    return SampledRates(samples, problems, priorities, rate_levels(step, low, high), seed)
+
+
+def distribution(totals, bins=40):
+    """Summary statistics and histogram of scenario totals"""
+    counts, edges = np.histogram(totals, bins=bins)
+    return {
+        'scenarios': len(totals),
+        'mean': float(totals.mean()),
+        'min': float(totals.min()),
+        'max': float(totals.max()),
+        'percentiles': {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(totals, PERCENTILES))},
+        'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()}
+    }
+
+
+def top_scenarios(totals, mean_rates, top_n=10, max_mean_rate=None):
+    """Indices of the ``top_n`` highest totals, best first, among scenarios within ``max_mean_rate``"""
+    candidates = np.arange(len(totals))
+    if max_mean_rate is not None:
+        candidates = candidates[mean_rates <= max_mean_rate]
+    top_n = min(top_n, len(candidates))
+    if top_n == 0:
+        return candidates[:0]
+    best = candidates[np.argpartition(totals[candidates], -top_n)[-top_n:]]
+    return best[np.argsort(totals[best], kind='stable')[::-1]]
+
+
+def sweep_state(customers, avg_mt, rates, top_n=10, max_mean_rate=None):
+    """Sweep one state's (problems x priorities) ``customers`` over ``rates``.
+
+    ``rates`` is (scenarios x priorities) for a grid, broadcast to every
+    problem, or SampledRates.
+    """
+    customers = np.asarray(customers, dtype=float)
+    if len(rates) * len(customers) > MAX_CELLS:
+        raise ValueError(f"{len(rates):,} scenarios of {len(customers)} problems exceed "
+                         f"{MAX_CELLS:,} scenario-problem totals")
+    if isinstance(rates, SampledRates):
+        problem_totals, totals = evaluate_scenarios(customers, rates, avg_mt, chunk_size=rates.chunk_size)
+        mean_rates = rates.mean_rates
+    else:
+        scenario_rates = np.broadcast_to(rates[:, None, :], (len(rates),) + customers.shape)
+        problem_totals, totals = evaluate_scenarios(customers, scenario_rates, avg_mt)
+        mean_rates = rates.mean(axis=1)
+    best = top_scenarios(totals, mean_rates, top_n, max_mean_rate)
+    return totals, {
+        'distribution': distribution(totals),
+        'top': [
+            {
+                'scenario': int(i),
+                'rates': rates[i].tolist(),
+                'mean_rate': float(mean_rates[i]),
+                'total_mt': float(totals[i]),
+                'problem_totals': problem_totals[i].tolist()
+            }
+            for i in best
+        ]
+    }
+
+
+def run_sweep(index, states, mode='grid', step=5, low=0, high=100, samples=100000,
+              top_n=10, max_mean_rate=None, seed=None):
+    """Sweep ``states`` of a StateIndex snapshot; JSON-ready result.
+
+    Grid sweeps also report the distribution and top-N of the totals
+    summed over all swept states.
+    """
+    if mode not in SWEEP_MODES:
+        raise ValueError(f"Unknown sweep mode {mode!r}")
+    start = time.perf_counter()
+    states = [state for state in states if state in index]
+    grid = grid_rates(len(PRIORITIES), step, low, high) if mode == 'grid' else None
+    results = {}
+    combined = None
+    for offset, state in enumerate(states):
+        customers = index.top_customers[state]
+        if mode == 'grid':
+            rates = grid
+        else:
+            rates = sample_rates(samples, len(customers), len(PRIORITIES), step, low, high,
+                                 None if seed is None else seed + offset)
+        totals, result = sweep_state(customers, index.avg_mt(state), rates, top_n, max_mean_rate)
+        result['problems'] = index.top_problems(state)['Lost Reason'].tolist()
+        results[state] = result
+        if mode == 'grid':
+            combined = totals if combined is None else combined + totals
+
+    response = {
+        'mode': mode,
+        'priorities': list(PRIORITIES),
+        'version': index.version,
+        'states': results
+    }
+    if combined is not None and len(states) > 1:
+        best = top_scenarios(combined, grid.mean(axis=1), top_n, max_mean_rate)
+        response['combined'] = {
+            'distribution': distribution(combined),
+            'top': [{'scenario': int(i), 'rates': grid[i].tolist(), 'mean_rate': float(grid[i].mean()),
+                     'total_mt': float(combined[i])} for i in best]
+        }
+    response['seconds'] = time.perf_counter() - start
+    return response
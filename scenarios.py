@@ -0,0 +1,102 @@
+"""Named slider scenarios per state and user, in SQLite.
+
+A scenario is the slider rates (P1-P4) of a state's top problems, saved
+under a name. Rates are stored per problem name rather than by position,
+so a scenario still lines up with the sliders after a reload changes the
+order of the top problems; problems it does not cover take the default
+rate. States can be drill-down node keys.
+
+Rows are keyed by (state, user, name), which serves listing one user's
+scenarios of a state; the (state, name) index serves lookups of a name
+across users.
+"""
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from recovery_engine import compute_recovery
+from sqlite_db import connect, create
+
+DEFAULT_RATE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    state TEXT NOT NULL,
+    user TEXT NOT NULL,
+    name TEXT NOT NULL,
+    rates TEXT NOT NULL,
+    saved TEXT NOT NULL,
+    PRIMARY KEY (state, user, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scenarios_state_name ON scenarios (state, name);
+"""
+
+
+def problem_rates(calculations_data):
+    """{problem name: [P1-P4 rates]} of a calculations-store payload"""
+    return {
+        problem['name']: [priority['conversion_rate'] for priority in problem['priorities']]
+        for problem in calculations_data.get('problems', [])
+    }
+
+
+def rate_vector(rates, problem_names, priorities=4):
+    """Flat slider rates (problem-major) for ``problem_names`` from a saved scenario"""
+    default = [DEFAULT_RATE] * priorities
+    return [rate for name in problem_names for rate in rates.get(name, default)]
+
+
+class ScenarioStore:
+    """Saved slider scenarios in one SQLite file, shared by all processes"""
+
+    def __init__(self, path):
+        self.path = path
+        create(path, SCHEMA)
+
+    def save(self, state, name, rates, user=''):
+        """Save (or overwrite) ``name``: ``rates`` maps problem names to P1-P4 rates"""
+        with connect(self.path) as conn:
+            conn.execute('INSERT OR REPLACE INTO scenarios VALUES (?, ?, ?, ?, ?)',
+                         (state, user, name, json.dumps(rates), datetime.now().isoformat(timespec='seconds')))
+
+    def delete(self, state, name, user=''):
+        with connect(self.path) as conn:
+            return conn.execute('DELETE FROM scenarios WHERE state = ? AND user = ? AND name = ?',
+                                (state, user, name)).rowcount > 0
+
+    def names(self, state, user=''):
+        with connect(self.path) as conn:
+            return [row[0] for row in conn.execute(
+                'SELECT name FROM scenarios WHERE state = ? AND user = ? ORDER BY name', (state, user))]
+
+    def rates(self, state, name, user=''):
+        """Saved {problem name: rates} of a scenario, or None"""
+        with connect(self.path) as conn:
+            row = conn.execute('SELECT rates FROM scenarios WHERE state = ? AND user = ? AND name = ?',
+                               (state, user, name)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def scenario_diff(problem_names, customers, rates_a, rates_b, avg_mt, priorities=4):
+    """Per-problem recovery of two scenarios and the change from A to B.
+
+    Both scenarios are evaluated in one broadcast ``compute_recovery`` over
+    a (2 x problems x priorities) rate stack. Returns a frame with the
+    rates of each scenario, their recovery (MT) and the difference.
+    """
+    customers = np.asarray(customers, dtype=float)[:len(problem_names)]
+    stack = np.array([rate_vector(rates_a, problem_names, priorities),
+                      rate_vector(rates_b, problem_names, priorities)], dtype=float)
+    stack = stack.reshape(2, len(problem_names), priorities)
+    totals = compute_recovery(customers, stack, avg_mt)['problem_totals']
+    return pd.DataFrame({
+        'Problem': problem_names,
+        'Rates A (%)': ['/'.join(f"{rate:g}" for rate in row) for row in stack[0]],
+        'Rates B (%)': ['/'.join(f"{rate:g}" for rate in row) for row in stack[1]],
+        'Recovery A (MT)': totals[0],
+        'Recovery B (MT)': totals[1],
+        'Change (MT)': totals[1] - totals[0],
+        'Rates changed': (stack[0] != stack[1]).sum(axis=1)
+    })
@@ -0,0 +1,150 @@
+"""Server-side scenario state: the browser holds a key, not the payload.
+
+The calculations-store payload grows with problems x priorities and is
+posted back as callback State on every page switch, slider change and
+export. With a session store the server keeps the payload and the
+browser's store holds only ``{'ref': key}``.
+
+Entries are immutable and keyed by the hash of their content, so a key
+names the same payload in every worker. Each process keeps recently used
+entries in an in-process LRU; every entry is also written through to a
+SQLite file shared by the workers on the host, where a worker that did
+not compute a scenario finds it. Entries not used for ``ttl`` seconds are
+pruned from the file: every put marks its entry used in the file, and a
+get served from memory does so at most once per ``ttl / 10`` seconds.
+Hit/miss/eviction counters are kept per process.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_db import connect, create
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_used ON sessions (used);
+"""
+
+
+class SessionStore:
+    """Content-addressed JSON payloads: in-process LRU over a shared SQLite file"""
+
+    def __init__(self, path, max_entries=1024, ttl=86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._writes = 0
+        self._memory = OrderedDict()
+        # key -> when this process last marked it used in the file
+        self._touched = {}
+        self._lock = threading.Lock()
+        create(path, SCHEMA)
+
+    def _remember(self, key, payload, used):
+        with self._lock:
+            self._memory[key] = payload
+            self._memory.move_to_end(key)
+            self._touched[key] = used
+            while len(self._memory) > self.max_entries:
+                evicted, _ = self._memory.popitem(last=False)
+                self._touched.pop(evicted, None)
+                self.evictions += 1
+
+    def _touch(self, key, used):
+        with connect(self.path) as conn:
+            conn.execute('UPDATE sessions SET used = ? WHERE key = ?', (used, key))
+
+    def put(self, payload):
+        """Store ``payload`` (JSON-serializable) and return its key"""
+        value = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        key = hashlib.sha1(value.encode()).hexdigest()
+        now = time.time()
+        with self._lock:
+            known = key in self._memory
+            if known:
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+            else:
+                self._writes += 1
+            prune = not known and self.ttl and self._writes % max(self.max_entries // 8, 1) == 0
+        with connect(self.path) as conn:
+            # Another process may have pruned it since this one stored it
+            conn.execute('INSERT INTO sessions VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET used = excluded.used',
+                         (key, value, now))
+        if known:
+            return key
+        self._remember(key, json.loads(value), now)
+        if prune:
+            self.prune()
+        return key
+
+    def get(self, key):
+        """Payload stored under ``key``, or None if unknown or expired"""
+        now = time.time()
+        with self._lock:
+            payload = self._memory.get(key)
+            touch = False
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                touch = self.ttl and now - self._touched.get(key, 0) > self.ttl / 10
+                if touch:
+                    self._touched[key] = now
+        if payload is not None:
+            if touch:
+                self._touch(key, now)
+            return payload
+        with connect(self.path) as conn:
+            row = conn.execute('SELECT value, used FROM sessions WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                row = None
+            if row is not None:
+                conn.execute('UPDATE sessions SET used = ? WHERE key = ?', (now, key))
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        payload = json.loads(row[0])
+        self._remember(key, payload, now)
+        with self._lock:
+            self.hits += 1
+        return payload
+
+    def prune(self):
+        """Delete entries of the shared file not used for ``ttl`` seconds"""
+        if not self.ttl:
+            return 0
+        with connect(self.path) as conn:
+            expired = conn.execute('DELETE FROM sessions WHERE used < ?', (time.time() - self.ttl,)).rowcount
+        with self._lock:
+            self.expirations += expired
+        return expired
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            evictions, expirations = self.evictions, self.expirations
+            entries = len(self._memory)
+        with connect(self.path) as conn:
+            stored = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+            'evictions': evictions,
+            'expirations': expirations,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'stored': stored
+        }
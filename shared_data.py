@@ -0,0 +1,197 @@
+"""Lost-deals table shared by all gunicorn workers through memory-mapped files.
+
+The gunicorn master (gunicorn.conf.py) loads the table once and publishes
+it as one ``.npy`` file per column (categorical codes for State and Lost
+Reason) plus a manifest with the categories, each state's row range and
+its precomputed top problems, summary and priority totals. Rows are
+grouped by state, so every partition is a slice of the mapped columns.
+
+Workers attach to the current version read-only: the column pages sit in
+the page cache once and are shared by every worker, and building a
+worker's StateIndex costs O(states) rather than O(rows): categorical
+columns keep their codes in the mapped pages, and only their categories
+are built per worker. The primary worker polls the source, publishes each
+reload as a new version and repoints ``CURRENT``; a SharedDataWatcher in
+every other worker swaps the new index in.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from data_store import TOP_PROBLEMS, DataStore, StateIndex
+
+logger = logging.getLogger(__name__)
+
+CURRENT = 'CURRENT'
+MANIFEST = 'manifest.json'
+
+
+def _write_version(index, path):
+    parts = [index.partitions[state] for state in index.states]
+    frame = pd.concat(parts, ignore_index=True) if parts else index.frame.iloc[:0]
+    columns = []
+    for position, name in enumerate(frame.columns):
+        values = frame[name]
+        if not isinstance(values.dtype, pd.CategoricalDtype) and not pd.api.types.is_numeric_dtype(values.dtype):
+            values = values.astype('category')
+        entry = {'name': name, 'file': f'{position}.npy', 'categories': None}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            entry['categories'] = values.cat.categories.tolist()
+            array = values.cat.codes.to_numpy()
+        else:
+            array = values.to_numpy()
+        np.save(os.path.join(path, entry['file']), array)
+        columns.append(entry)
+
+    states = []
+    start = 0
+    for state, part in zip(index.states, parts):
+        states.append({
+            'state': state,
+            'start': start,
+            'stop': start + len(part),
+            'top': part.index.get_indexer(index.top[state].index).tolist(),
+            'summary': index.summaries[state],
+            'priority_totals': index.priority_totals[state]
+        })
+        start += len(part)
+
+    manifest = {'version': index.version, 'top_n': index.top_n, 'rows': len(frame),
+                'columns': columns, 'states': states}
+    with open(os.path.join(path, MANIFEST), 'w') as fh:
+        json.dump(manifest, fh)
+
+
+def publish_index(index, directory, keep=3):
+    """Write ``index`` under ``directory`` as a new version and make it current"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, index.version)
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        tmp = os.path.join(directory, f'.{index.version}.{uuid.uuid4().hex}.tmp')
+        os.makedirs(tmp)
+        try:
+            _write_version(index, tmp)
+            os.rename(tmp, path)
+        except OSError:
+            # Another publisher got there first
+            if not os.path.exists(os.path.join(path, MANIFEST)):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    pointer = os.path.join(directory, f'.{CURRENT}.{uuid.uuid4().hex}.tmp')
+    with open(pointer, 'w') as fh:
+        fh.write(index.version)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+    _prune(directory, index.version, keep)
+    return path
+
+
+def _prune(directory, current, keep):
+    """Remove old versions; workers still mapping them keep their pages until they swap"""
+    versions = sorted(
+        (entry for entry in os.scandir(directory)
+         if entry.is_dir() and not entry.name.startswith('.') and entry.name != current),
+        key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[max(keep - 1, 0):]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def current_version(directory):
+    try:
+        with open(os.path.join(directory, CURRENT)) as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def attach_index(directory, version=None):
+    """StateIndex over the memory-mapped columns of a published version (the current one by default)"""
+    version = version or current_version(directory)
+    if version is None:
+        raise FileNotFoundError(f"No lost-deals table published in {directory}")
+    path = os.path.join(directory, version)
+    with open(os.path.join(path, MANIFEST)) as fh:
+        manifest = json.load(fh)
+
+    # Empty arrays cannot be mapped
+    mmap_mode = 'r' if manifest['rows'] else None
+    columns = {}
+    for entry in manifest['columns']:
+        array = np.load(os.path.join(path, entry['file']), mmap_mode=mmap_mode)
+        if entry['categories'] is not None:
+            # Wraps the mapped codes without copying them
+            array = pd.Categorical.from_codes(array, categories=entry['categories'])
+        columns[entry['name']] = array
+    frame = pd.DataFrame(columns, copy=False)
+
+    parts = (
+        (entry['state'], frame.iloc[entry['start']:entry['stop']], entry['top'],
+         entry['summary'], entry['priority_totals'])
+        for entry in manifest['states']
+    )
+    return StateIndex.from_parts(frame, manifest['version'], manifest['top_n'], parts)
+
+
+class SharedDataStore(DataStore):
+    """DataStore of the publishing process: every rebuild is also published to ``directory``.
+
+    Given an ``index`` already attached from ``directory`` nothing is
+    published up front. After a rebuild the store attaches the version it
+    published, so the publisher also reads the shared pages rather than
+    keeping a private copy.
+    """
+
+    def __init__(self, frame, directory, top_n=TOP_PROBLEMS, index=None):
+        super().__init__(frame, index=index, top_n=top_n)
+        self.directory = directory
+        if index is None:
+            publish_index(self.current, directory)
+
+    def rebuild(self, frame, changed_states=None):
+        index = super().rebuild(frame, changed_states)
+        publish_index(index, self.directory)
+        return self.swap(attach_index(self.directory, index.version))
+
+
+class SharedDataWatcher:
+    """Swaps newly published versions into a worker's DataStore"""
+
+    def __init__(self, directory, store, interval=30.0):
+        self.directory = directory
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check_once(self):
+        """Attach the current version if it differs from the store's; returns True on a swap"""
+        version = current_version(self.directory)
+        if version is None or version == self.store.version:
+            return False
+        self.store.swap(attach_index(self.directory, version))
+        logger.info("Attached shared lost-deals data version %s", version)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check_once()
+            except Exception:
+                logger.exception("Attaching shared lost-deals data failed; keeping previous data")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='shared-data-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
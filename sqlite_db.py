@@ -0,0 +1,31 @@
+"""SQLite files shared by the dashboard's processes.
+
+``create`` makes a database file (and its directory) in WAL mode, so
+readers in other processes do not block the writer, and applies a schema.
+``connect`` opens a connection that commits when the block succeeds, rolls
+back when it raises and is closed either way.
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+
+
+@contextmanager
+def connect(path, read_only=False):
+    if read_only:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    else:
+        conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def create(path, schema):
+    """Create the database at ``path`` if needed and apply ``schema`` (idempotent DDL)"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with connect(path) as conn:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(schema)
@@ -0,0 +1,106 @@
+"""Chunked CSV and Parquet exports of a state's analysis and raw rows.
+
+The generators here yield a file a piece at a time for a Flask streaming
+response. Rows are converted ``chunk_rows`` at a time (plain dtypes via
+``expand_frame``, then encoded), so memory stays bounded by one chunk
+whatever the size of the state. Parquet goes out one row group per chunk.
+
+pyarrow is imported on first use and only needed for Parquet;
+``parquet_available`` tells whether it is installed.
+"""
+import importlib.util
+import io
+
+import pandas as pd
+
+from data_loader import expand_frame
+
+CHUNK_ROWS = 50_000
+STREAM_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+DATASETS = ('analysis', 'raw')
+ANALYSIS_COLUMNS = [
+    'State', 'Problem', 'Priority', 'Lost Customers', 'Conversion Rate (%)',
+    'Potential Customers', 'Recovery Potential (MT)', 'Problem Total (MT)'
+]
+
+
+def parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def analysis_frames(state, calculations_data, chunk_rows=CHUNK_ROWS):
+    """Detailed analysis, one row per problem and priority, in frames of up to ``chunk_rows``"""
+    rows = []
+    emitted = False
+    for problem in calculations_data['problems']:
+        for priority in problem['priorities']:
+            rows.append((state, problem['name'], priority['priority'], priority['customers'],
+                         priority['conversion_rate'], priority['potential_customers'],
+                         priority['potential_mt'], problem['total_mt']))
+            if len(rows) == chunk_rows:
+                yield pd.DataFrame(rows, columns=ANALYSIS_COLUMNS)
+                rows = []
+                emitted = True
+    if rows or not emitted:
+        yield pd.DataFrame(rows, columns=ANALYSIS_COLUMNS)
+
+
+def raw_frames(partition, chunk_rows=CHUNK_ROWS):
+    """A state's lost-deals rows with plain dtypes, ``chunk_rows`` at a time"""
+    for start in range(0, max(len(partition), 1), chunk_rows):
+        yield expand_frame(partition.iloc[start:start + chunk_rows])
+
+
+def iter_csv(frames):
+    """CSV bytes, one piece per frame; the header comes with the first"""
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header).encode()
+        header = False
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last ``drain``"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet(frames):
+    """Parquet bytes, one row group per frame; the footer comes last"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()